@@ -8,16 +8,17 @@ Login Page — Cake Business Simulation
 
 import base64
 import streamlit as st
-from supabase import create_client
-import os
-from dotenv import load_dotenv
 from pathlib import Path
 import bcrypt
 
+from utils.db import get_client, get_team
+from utils.query_trace import start_trace
+
 # ======================================
 # ⚙️ INITIAL SETUP
 # ======================================
 st.set_page_config(page_title="Cake Business Game", page_icon="🎂", layout="centered")
+start_trace("Login")
 
 # Session defaults
 if "logged_in" not in st.session_state:
@@ -30,19 +31,13 @@ if not st.session_state.logged_in:
     st.sidebar.empty()
 
 # ======================================
-# 🌍 LOAD SUPABASE CREDENTIALS
+# 🌍 SUPABASE CLIENT (shared across reruns)
 # ======================================
-env_path = Path(__file__).parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
+try:
+    supabase = get_client()
+except RuntimeError:
     st.error("❌ Supabase credentials missing. Please check your .env file.")
     st.stop()
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 # ======================================
 # 🖼️ BACKGROUND IMAGE
 # ======================================
@@ -173,10 +168,9 @@ if not st.session_state.logged_in:
     password = st.text_input("Password", type="password")
 
     if st.button("Login"):
-        response = supabase.table("teams").select("*").eq("team_name", team_name).execute()
+        team = get_team(team_name)
 
-        if response.data:
-            team = response.data[0]
+        if team:
             stored_hash = team["password"].encode("utf-8")
             entered_pw = password.encode("utf-8")
 
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Market Equilibrium Benchmark — Cake Simulation
+
+Solves the best-response equilibrium (utils.equilibrium) on the reference
+catalog for cohorts of several sizes, reporting wall time, iterations and
+the largest remaining gap.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_equilibrium
+    python -m benchmarks.bench_equilibrium --sizes 200 2000 --spread 0.3
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from utils.catalog import load_catalog
+from utils.equilibrium import solve_equilibrium, team_costs
+from utils.offline_backend import OfflineClient, reference_tables
+
+
+DEFAULT_SIZES = [10, 200, 1000, 5000]
+
+
+def run_size(catalog, n_teams, spread=0.0, seed=0):
+    """Solve one cohort of `n_teams` and return its measurements."""
+    costs = team_costs(catalog, [f"team_{i:05d}" for i in range(n_teams)], spread=spread, seed=seed)
+
+    start = time.perf_counter()
+    equilibrium = solve_equilibrium(catalog, costs)
+    wall = time.perf_counter() - start
+
+    return {
+        "teams": n_teams,
+        "wall (s)": round(wall, 3),
+        "iterations": equilibrium.iterations,
+        "converged": equilibrium.converged,
+        "gap ($)": round(equilibrium.gap, 4),
+        "regret / profit": round(equilibrium.regret.sum() / max(equilibrium.profit.sum(), 1e-9), 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the market equilibrium solver.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="cohort sizes (number of teams)")
+    parser.add_argument("--spread", type=float, default=0.0,
+                        help="unit cost spread between teams (0.2 = ±20%%)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    catalog = load_catalog(OfflineClient(reference_tables()))
+    table = pd.DataFrame([run_size(catalog, n, args.spread, args.seed) for n in args.sizes])
+    print(table.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
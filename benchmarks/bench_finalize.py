@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Round Finalization Benchmark — Cake Simulation
+
+Generates synthetic cohorts (teams, price submissions, production plans)
+and runs finalize_round against the offline backend, reporting wall time,
+database round-trips and peak memory for each cohort size. Each run starts
+with an empty catalog cache, so every size includes the catalog load.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_finalize
+    python -m benchmarks.bench_finalize --sizes 100 1000 --latency-ms 40 --json bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from utils.catalog import invalidate_catalog
+from utils.finalize_round import finalize_round
+from utils.offline_backend import DATA_DIR, OfflineClient, reference_tables
+
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+# =====================================
+# 🧪 SYNTHETIC COHORT
+# =====================================
+def synthetic_cohort(n_teams, round_number=3, seed=0):
+    """Seed tables for `n_teams` teams, ready to finalize `round_number`."""
+    rng = np.random.default_rng(seed)
+    tables = reference_tables()
+    caps = pd.read_csv(f"{DATA_DIR}/price_caps.csv", encoding="utf-8-sig")
+    cakes = [c["name"] for c in tables["cakes"]]
+    channels = [c["channel"] for c in tables["channels"]]
+
+    teams = [f"team_{i:05d}" for i in range(n_teams)]
+    tables["teams"] = [
+        {
+            "id": i + 1,
+            "team_name": team,
+            "money": float(rng.uniform(500, 5000)),
+            "stock_value": float(rng.uniform(0, 2000)),
+            "total_value": 0.0,
+            "last_finalized_round": round_number - 1,
+        }
+        for i, team in enumerate(teams)
+    ]
+
+    max_price = caps.set_index(["cake", "channel"])["max_price"].to_dict()
+    prices = []
+    for rnd in range(1, round_number + 1):
+        # Some teams skip the current round so the auto-fill path runs too
+        submit = rng.random(n_teams) < (0.8 if rnd == round_number else 0.95)
+        for team in np.array(teams)[submit]:
+            entries = [
+                {
+                    "cake": cake,
+                    "channel": ch,
+                    "price_usd": round(float(rng.uniform(4, max_price.get((cake, ch), 20))), 2),
+                }
+                for cake in cakes
+                for ch in channels
+            ]
+            prices.append({
+                "id": len(prices) + 1,
+                "team_name": str(team),
+                "round_number": rnd,
+                "prices_json": json.dumps(entries),
+                "finalized": True,
+                "auto_filled": False,
+            })
+    tables["prices"] = prices
+
+    plans = []
+    planning = rng.random(n_teams) < 0.9
+    for team in np.array(teams)[planning]:
+        made = rng.choice(cakes, size=int(rng.integers(1, 5)), replace=False)
+        plan = [
+            {"cake": str(cake), "channel": ch, "qty": int(rng.integers(4, 40))}
+            for cake in made
+            for ch in channels
+            if rng.random() < 0.7
+        ]
+        required = {
+            "prep": float(rng.uniform(1, 20)),
+            "oven": float(rng.uniform(1, 10)),
+            "package": float(rng.uniform(1, 10)),
+            "oven rental": float(rng.uniform(0, 10)),
+        }
+        plans.append({
+            "id": len(plans) + 1,
+            "team_name": str(team),
+            "round_number": round_number,
+            "plan_json": json.dumps(plan),
+            "required_json": json.dumps(required),
+            "profit_usd": None,
+        })
+    tables["production_plans"] = plans
+
+    return tables
+
+
+# =====================================
+# ⏱️ RUN
+# =====================================
+def _finalize(tables, round_number, latency):
+    # Every run loads the reference catalog, not only the first size
+    invalidate_catalog()
+    client = OfflineClient(tables, latency=latency)
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = finalize_round(round_number, supabase=client)
+
+    # A run that lost plan writes would look faster than it is
+    unsettled = [
+        p["team_name"] for p in client.tables["production_plans"]
+        if p["round_number"] == round_number and p.get("profit_usd") is None
+    ]
+    assert not unsettled, f"{len(unsettled)} production plan(s) without a profit, e.g. {unsettled[0]}"
+    return client, report
+
+
+def run_size(n_teams, round_number=3, latency=0.0, seed=0, memory=True):
+    """
+    Finalize one synthetic cohort and return its measurements. Peak memory
+    comes from a second, traced run so tracing overhead never skews timing.
+    """
+    tables = synthetic_cohort(n_teams, round_number, seed)
+
+    start = time.perf_counter()
+    client, report = _finalize(tables, round_number, latency)
+    wall = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        _finalize(tables, round_number, 0.0)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "teams": n_teams,
+        "wall_seconds": wall,
+        "round_trips": client.requests,
+        "peak_mib": peak / 2 ** 20 if peak is not None else None,
+        "phases": {p["phase"]: p["seconds"] for p in report["phases"]},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark finalize_round on synthetic cohorts.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="cohort sizes (number of teams)")
+    parser.add_argument("--round", type=int, default=3, help="round to finalize")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="simulated network latency per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the traced run that measures peak memory")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = [
+        run_size(n, round_number=args.round, latency=args.latency_ms / 1000,
+                 seed=args.seed, memory=not args.no_memory)
+        for n in args.sizes
+    ]
+
+    table = pd.DataFrame([
+        {
+            "teams": r["teams"],
+            "wall (s)": round(r["wall_seconds"], 3),
+            "round-trips": r["round_trips"],
+            "peak (MiB)": round(r["peak_mib"], 1) if r["peak_mib"] is not None else "-",
+            **{f"{phase} (s)": round(sec, 3) for phase, sec in r["phases"].items()},
+        }
+        for r in results
+    ])
+    print(table.to_string(index=False))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Offline Finalization Check — Cake Simulation
+
+Runs the Admin panel's round advance end to end against the offline
+backend (CAKEGAME_BACKEND=offline): one team submits prices and a plan
+through the page client (utils.db.get_client()), the round is previewed
+and then finalized in the background job, and the check asserts that
+the job settled the teams in that same in-memory database.
+
+Run from the repository root:
+
+    python -m benchmarks.check_offline
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+from utils.catalog import get_catalog
+from utils.db import get_client, get_current_round
+from utils.finalize_games import advance_round
+from utils.finalize_job import start_finalize_job
+from utils.finalize_round import finalize_round
+
+
+TIMEOUT_SECONDS = 30.0
+
+
+def submit_plan(supabase, team, round_number, price=9.0, qty=20):
+    """Prices for every (cake, channel) and a plan of `qty` units of each."""
+    catalog = get_catalog()
+    pairs = [(cake, channel) for cake in catalog.cake_names for channel in catalog.channel_names]
+    supabase.table("prices").insert({
+        "team_name": team,
+        "round_number": round_number,
+        "prices_json": json.dumps([{"cake": c, "channel": ch, "price_usd": price} for c, ch in pairs]),
+        "finalized": True,
+        "auto_filled": False,
+    }).execute()
+    supabase.table("production_plans").insert({
+        "team_name": team,
+        "round_number": round_number,
+        "plan_json": json.dumps([{"cake": c, "channel": ch, "qty": qty} for c, ch in pairs]),
+        "required_json": json.dumps({"prep": 1.0, "oven": 1.0, "package": 1.0, "oven rental": 0.0}),
+        "profit_usd": None,
+    }).execute()
+
+
+def check():
+    """Finalize one round as the Admin page does; raises AssertionError on a mismatch."""
+    os.environ["CAKEGAME_BACKEND"] = "offline"
+    supabase = get_client()
+    round_number = get_current_round(supabase)
+    teams = supabase.table("teams").select("*").execute().data
+    team = teams[0]["team_name"]
+    submit_plan(supabase, team, round_number)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        preview = finalize_round(round_number, dry_run=True).set_index("team_name")
+        profit = float(preview.loc[team, "last_profit"])
+        assert profit != 0, f"preview shows no profit for {team}, who has a plan"
+
+        job = start_finalize_job(round_number, on_success=lambda r: advance_round(supabase, r))
+        deadline = time.monotonic() + TIMEOUT_SECONDS
+        while job.active and time.monotonic() < deadline:
+            time.sleep(0.05)
+    assert job.status == "done", f"finalization ended as {job.status}: {job.error}"
+
+    settled = {t["team_name"]: t for t in supabase.table("teams").select("*").execute().data}
+    unsettled = [name for name, t in settled.items() if t.get("last_finalized_round") != round_number]
+    assert not unsettled, f"{len(unsettled)} team(s) not settled, e.g. {unsettled[0]}"
+
+    money = float(settled[team]["money"])
+    expected = float(preview.loc[team, "money"])
+    assert abs(money - expected) < 0.01, f"{team} has ${money:.2f}, the preview said ${expected:.2f}"
+    stored = supabase.table("competitor_prices").select("cake").eq("round_number", round_number).execute().data
+    assert stored, f"no competitor_prices stored for Round {round_number}"
+    assert get_current_round(supabase) == round_number + 1, "the round was not advanced"
+
+    return {"round_number": round_number, "teams": len(settled), "team": team, "profit": profit, "money": money}
+
+
+def main():
+    result = check()
+    print(f"✅ Round {result['round_number']} settled {result['teams']} team(s) offline; "
+          f"{result['team']} made ${result['profit']:,.2f} and now has ${result['money']:,.2f}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
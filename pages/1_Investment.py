@@ -8,33 +8,31 @@ Created on Thu Oct 23 14:47:57 2025
 import streamlit as st
 import pandas as pd
 import json
-import os
-from supabase import create_client
-from dotenv import load_dotenv
-from pathlib import Path
 from datetime import date, datetime, timedelta
 import pytz
+
+from utils.catalog import get_catalog
+from utils.db import get_client, get_current_round, get_team
+from utils.query_trace import start_trace
+from utils.write_queue import WRITE_TIMEOUT_SECONDS, submit_write
+
 BEIRUT_TZ = pytz.timezone("Asia/Beirut")
 
 
 # =====================================
 # 🌍 SUPABASE SETUP
 # =====================================
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-if not SUPABASE_URL or not SUPABASE_KEY:
+try:
+    supabase = get_client()
+except RuntimeError:
     st.error("❌ Missing Supabase credentials. Check .env file.")
     st.stop()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 # ============================
 # 🧁 PAGE HEADER
 # ============================
 st.set_page_config(page_title="Investments", page_icon="💰", layout="wide")
+start_trace("Investment")
 
 # =====================================
 # 🔒 LOGIN CHECK
@@ -49,16 +47,9 @@ if "investment_saved" not in st.session_state:
 
 
 
-def get_current_round():
-    response = supabase.table("game_state").select("value").eq("key", "current_round").maybe_single().execute()
-    return int(response.data["value"])
-
 # 🔁 NEW LOGIC: always fetch round and store in session
 current_round = get_current_round()
 st.session_state.round = current_round
-def submissions_locked(supabase):
-    lock_row = supabase.table("game_state").select("value").eq("key", "locked").maybe_single().execute()
-    return lock_row.data and lock_row.data["value"] == "true"
 
 
 # =====================================
@@ -310,12 +301,17 @@ def save_on_cooldown():
 # 📊 LOAD CSV DATA
 # ============================
 try:
-    data_dir = Path(__file__).parent.parent / "data"
-    ingredients = pd.read_csv(data_dir / "ingredients.csv")
-    wages = pd.read_csv(data_dir / "wages_energy.csv")
+    catalog = get_catalog()
+    ingredients = catalog.ingredients
+    wages = catalog.wages
 except FileNotFoundError:
     st.error("❌ Missing required CSV files (ingredients.csv or wages_energy.csv).")
     st.stop()
+except Exception as e:
+    # A cold catalog also reads cakes, channels and recipes from Supabase
+    st.error("❌ Failed to load reference data.")
+    st.exception(e)
+    st.stop()
 
 valid_params = [
     "prep_wage_usd_per_hour",
@@ -364,9 +360,9 @@ ingredients_df["Current stock (num)"] = (
 ingredients_df["Current stock"] = ingredients_df["Current stock (num)"].map(lambda x: f"{x:g}")
 
 # ✅ Financial calculations use the numeric version
-team_finances = supabase.table("teams").select("money, stock_value").eq("team_name", st.session_state.team_name).maybe_single().execute()
+team_finances = get_team(st.session_state.team_name, "money, stock_value")
 
-current_balance = float(team_finances.data["money"])
+current_balance = float(team_finances["money"])
 st.session_state.money = current_balance  # keep UI consistent
 
 # Ingredient stock value
@@ -555,9 +551,9 @@ capacity_entries = [
 # 📈 SUMMARY
 # ============================
 st.markdown("---")
-team_data = supabase.table("teams").select("money").eq("team_name", st.session_state.team_name).execute()
-if team_data.data:
-    current_balance = team_data.data[0]["money"]
+team_data = get_team(st.session_state.team_name, "money")
+if team_data:
+    current_balance = team_data["money"]
     st.session_state.money = current_balance
 else:
     current_balance = st.session_state.money
@@ -596,16 +592,18 @@ if st.button("💾 Save Investment", disabled=button_disabled):
 # ================================
 if st.session_state.saving_investment:
     try:
-        supabase.rpc(
-            "save_investment_atomic",
+        # Batched with other teams' submissions (see utils.write_queue)
+        submit_write(
+            "investment",
             {
                 "p_team_name": st.session_state.team_name,
                 "p_round": current_round,
                 "p_ingredients": ingredient_entries,
                 "p_capacity": capacity_entries,
                 "p_total": total_investment
-            }
-        ).execute()
+            },
+            supabase=supabase,
+        ).result(timeout=WRITE_TIMEOUT_SECONDS)
 
         # Reset the saving flag so button becomes active again
         st.session_state.saving_investment = False
@@ -5,23 +5,29 @@ Market Demand Page - Cake Game
 Now round-based instead of date-based.
 """
 
-import os
 import json
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
 import streamlit as st
-from pathlib import Path
-from dotenv import load_dotenv
-from supabase import create_client
 import pytz
-import math
+
+from utils.catalog import get_catalog
+from utils.competitor_prices import competitor_prices, competitor_prices_query
+from utils.db import get_client, get_current_round, read_concurrently, submissions_locked
+from utils.demand import demand_curves
+from utils.editor_tables import price_table, read_price_table
+from utils.pricing import recommend_prices
+from utils.query_trace import start_trace
+from utils.settlement import plan_lines
+from utils.write_queue import WRITE_TIMEOUT_SECONDS, submit_write
 
 
 BEIRUT_TZ = pytz.timezone("Asia/Beirut")
 
 st.set_page_config(page_title="Demand", page_icon="📈", layout="wide")
+start_trace("Demand")
 
 # =====================================
 # 🔒 LOGIN CHECK
@@ -42,33 +48,12 @@ if today.isoformat() in CLOSED_DATES:
 # =====================================
 # 🌍 SUPABASE SETUP
 # =====================================
-
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
+try:
+    supabase = get_client()
+except RuntimeError:
     st.error("❌ Missing Supabase credentials. Check .env file.")
     st.stop()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-def submissions_locked(supabase):
-    lock_row = supabase.table("game_state").select("value").eq("key", "locked").single().execute()
-    return lock_row.data and lock_row.data["value"] == "true"
-
-def get_current_round():
-    response = (
-        supabase.table("game_state")
-        .select("value")
-        .eq("key", "current_round")
-        .single()
-        .execute()
-    )
-    return int(response.data["value"])
-
 
 # =====================================
 # 🔄 CURRENT ROUND
@@ -312,15 +297,37 @@ st.markdown(
 st.title("📈 Market Demand")
 st.write(f"Welcome, **{st.session_state.team_name}**!")
 
-# Load current balance from DB (and sync session)
-try:
-    team_finances = (
+# Every read below is independent of the others: start them all at once
+prev_round = round_number - 1
+reads = read_concurrently(
+    balance=(
         supabase.table("teams")
         .select("money")
         .eq("team_name", st.session_state.team_name)
         .single()
-        .execute()
-    )
+    ),
+    # All of this team's price submissions: this round's status, prefill and history
+    my_prices=(
+        supabase.table("prices")
+        .select("*")
+        .eq("team_name", st.session_state.team_name)
+        .order("round_number", desc=True)
+    ),
+    # Previous round's competitor averages, stored when it was finalized
+    prev_avg=competitor_prices_query(supabase, prev_round) if prev_round > 0 else None,
+    # This round's production plan, for the uncertainty view's quantities
+    plan=(
+        supabase.table("production_plans")
+        .select("team_name, plan_json")
+        .eq("team_name", st.session_state.team_name)
+        .eq("round_number", round_number)
+        .limit(1)
+    ) if st.session_state.get("demand_uncertainty") else None,
+)
+
+# Load current balance from DB (and sync session)
+try:
+    team_finances = reads.response("balance")
     current_balance = float(team_finances.data["money"])
     st.session_state.money = current_balance
 except Exception:
@@ -333,19 +340,13 @@ st.write(f"Current Balance: **${current_balance:,.2f}**")
 # =====================================
 
 try:
-    cakes_df = pd.DataFrame(
-        supabase.table("cakes").select("name").execute().data
-    )
-    channels_df = pd.DataFrame(
-        supabase.table("channels").select("*").execute().data
-    )
+    catalog = get_catalog()
 except Exception:
-    local_path = os.path.join(os.path.dirname(__file__), "..", "data", "channels.csv")
-    if os.path.exists(local_path):
-        channels_df = pd.read_csv(local_path)
-    else:
-        st.error("❌ Could not load channels.")
-        st.stop()
+    st.error("❌ Could not load cakes and channels.")
+    st.stop()
+
+cakes_df = catalog.cakes
+channels_df = catalog.channels
 
 if cakes_df.empty or channels_df.empty:
     st.error("❌ Missing data: please ensure cakes and channels exist.")
@@ -354,27 +355,15 @@ if cakes_df.empty or channels_df.empty:
 # =====================================
 # 📌 LOAD PRICE CAPS
 # =====================================
-caps_path = os.path.join(os.path.dirname(__file__), "..", "data", "price_caps.csv")
-price_caps_df = pd.read_csv(caps_path)
-
-# Build lookup: (channel, cake) → max_price
-price_caps = {
-    (row["channel"], row["cake"]): float(row["max_price"])
-    for _, row in price_caps_df.iterrows()
-}
+# Lookup: (channel, cake) → max_price
+price_caps = catalog.max_price
 
 # =====================================
 # 🔒 CHECK IF PRICES ALREADY FINALIZED FOR THIS ROUND
 # =====================================
 
-existing_final = (
-    supabase.table("prices")
-    .select("id, finalized, auto_filled, round_number")
-    .eq("team_name", st.session_state.team_name)
-    .eq("round_number", round_number)
-    .execute()
-    .data
-)
+my_prices = reads.data("my_prices") or []
+existing_final = [r for r in my_prices if r.get("round_number") == round_number]
 
 record = existing_final[0] if existing_final else {}
 is_finalized = record.get("finalized", False)
@@ -411,91 +400,13 @@ table_inputs_disabled = False
 submit_disabled = finalized_this_round
 
 try:
-    # Fetch ALL competitor prices from the immediate previous round
-    prev_round = round_number - 1
-
-    # =====================================================
-    # 1) Load production plans for previous round (if any)
-    # =====================================================
-    if prev_round > 0:
-        prev_plans_resp = (
-            supabase.table("production_plans")
-            .select("team_name, plan_json")
-            .eq("round_number", prev_round)
-            .execute()
-        )
-        prev_plans = prev_plans_resp.data or []
-    else:
-        prev_plans = []
-    
-    produced_last_round = {}
-    
-    for row in prev_plans:
-        team = row.get("team_name")
-        raw_plan = row.get("plan_json")
-    
-        try:
-            plan_json = raw_plan if isinstance(raw_plan, list) else json.loads(raw_plan or "[]")
-        except Exception:
-            plan_json = []
-    
-        cakes = {item.get("cake") for item in plan_json if "cake" in item}
-        produced_last_round[team] = cakes
-    
-    # =====================================================
-    # 2) Load previous round price submissions (if any)
-    # =====================================================
-    if prev_round > 0:
-        prev_prices_resp = (
-            supabase.table("prices")
-            .select("team_name, prices_json")
-            .eq("round_number", prev_round)
-            .execute()
-        )
-        prev_prices_data = prev_prices_resp.data or []
-    else:
-        prev_prices_data = []
-    
-    # =====================================================
-    # 3) Filter ONLY prices of cakes the team actually produced
-    # =====================================================
-    prev_rows = []
-    
-    for rec in prev_prices_data:
-        team = rec.get("team_name")
-        raw_prices = rec.get("prices_json")
-    
-        try:
-            prices_list = raw_prices if isinstance(raw_prices, list) else json.loads(raw_prices or "[]")
-        except Exception:
-            prices_list = []
-    
-        for p in prices_list:
-            cake = p.get("cake")
-            channel = p.get("channel")
-    
-            # ONLY accept price if team produced that cake
-            if team in produced_last_round and cake in produced_last_round[team]:
-                prev_rows.append({
-                    "team_name": team,
-                    "cake": cake,
-                    "channel": channel,
-                    "price_usd": p.get("price_usd", 0),
-                })
-    
-    # =====================================================
-    # 4) Compute avg price safely
-    # =====================================================
-    if prev_rows:
-        prev_prices_df = pd.DataFrame(prev_rows)
-        avg_prices = (
-            prev_prices_df.groupby(["channel", "cake"])["price_usd"]
-            .mean()
-            .to_dict()
-        )
-    else:
-        avg_prices = {}
-
+    # Average price per (channel, cake) over teams that produced that cake
+    # in the previous round (see utils.competitor_prices)
+    try:
+        stored_avg = reads.data("prev_avg")
+    except Exception:
+        stored_avg = []  # not stored: computed live below
+    avg_prices = competitor_prices(supabase, prev_round, stored_avg)
 
 except Exception as e:
     avg_prices = {}
@@ -506,15 +417,7 @@ except Exception as e:
 # 📥 Load this round's existing prices to prefill the table
 # ============================
 
-today_prices_rec = (
-    supabase.table("prices")
-    .select("prices_json")
-    .eq("team_name", st.session_state.team_name)
-    .eq("round_number", round_number)
-    .limit(1)
-    .execute()
-    .data
-)
+today_prices_rec = existing_final[:1]
 
 prefill_map = {}  # (channel, cake) → price_usd
 
@@ -528,27 +431,16 @@ if today_prices_rec:
     except Exception:
         pass  # If corrupted or empty, just start clean
 
+# Suggested prices (💡 button below) replace the prefill for this round
+suggestion = st.session_state.get("suggested_prices")
+if suggestion and suggestion["round"] == round_number:
+    prefill_map.update(suggestion["prices"])
+
 # ============================
 # 📊 Build Pivot-Style Pricing Table
 # ============================
 
-pricing_rows = []
-
-for _, cake_row in cakes_df.iterrows():
-    cake = cake_row["name"]
-
-    row = {"Cake": cake}
-
-    for _, ch_row in channels_df.iterrows():
-        channel = ch_row["channel"]
-        prev_avg = avg_prices.get((channel, cake), 0.0)
-
-        row[f"{channel} (prev)"] = round(prev_avg, 2)
-        row[channel] = prefill_map.get((channel, cake), 0.0)
-
-    pricing_rows.append(row)
-
-pricing_df = pd.DataFrame(pricing_rows)
+pricing_df = price_table(cakes_df["name"].tolist(), channels_df["channel"].tolist(), prefill_map, avg_prices)
 
 # ============================
 # 📝 Column Configuration
@@ -585,12 +477,33 @@ Each price must be between **0** and its allowed maximum value.
 Even if you enter a higher value, it will **automatically be reduced** to the allowed maximum when saved.
 """)
 
+if st.button(
+    "💡 Suggest Prices",
+    help="Fills the table with the most profitable price for each cake and channel, given last "
+         "round's competitor prices and each cake's full unit cost (ingredients, labour, "
+         "packaging and transport).",
+):
+    try:
+        recommendation = recommend_prices(catalog, avg_prices)
+        st.session_state.suggested_prices = {
+            "round": round_number,
+            "prices": {
+                (r.channel, r.cake): float(r.price) for r in recommendation.itertuples()
+            },
+        }
+        # New editor key so the table is rebuilt from the suggestions
+        st.session_state.price_editor_version = st.session_state.get("price_editor_version", 0) + 1
+        st.rerun()
+    except Exception as e:
+        st.error("❌ Failed to suggest prices.")
+        st.exception(e)
+
 edited_prices = st.data_editor(
     pricing_df,
     use_container_width=True,
     hide_index=True,
     num_rows="fixed",
-    key="price_table",
+    key=f"price_table_{st.session_state.get('price_editor_version', 0)}",
     disabled=table_inputs_disabled,
     column_config=col_cfg,
 )
@@ -599,171 +512,103 @@ edited_prices = st.data_editor(
 # 📤 Convert wide format → long format for database
 # ============================
 
-pricing_entries = []
-
-for _, row in edited_prices.iterrows():
-    cake = row["Cake"]
-
-    for _, ch_row in channels_df.iterrows():
-        channel = ch_row["channel"]
-
-        raw_price = float(row[channel])
-
-        # lookup max allowed price (default: infinity)
-        max_allowed = price_caps.get((channel, cake), float("inf"))
-
-        # enforce bounds
-        clean_price = max(0, min(raw_price, max_allowed))
-
-        if clean_price > 0:
-            pricing_entries.append(
-                {
-                    "team_name": st.session_state.team_name,
-                    "channel": channel,
-                    "cake": cake,
-                    "price_usd": clean_price,
-                    "transport_cost_usd": float(
-                        channels_df.loc[
-                            channels_df["channel"] == channel,
-                            "transport_cost_per_unit_usd",
-                        ].iloc[0]
-                    ),
-                }
-            )
+pricing_entries = read_price_table(
+    edited_prices,
+    st.session_state.team_name,
+    channels_df["channel"].tolist(),
+    price_caps,
+    catalog.transport_cost,
+)
 
 
 # =====================================
-# 📊 CALCULATE DEMAND (TEST)
+# 📊 WHAT-IF DEMAND (LIVE)
 # =====================================
+# Answered from demand curves precomputed for this round's competitor
+# averages (utils.demand.DemandCurves): every edit of the price table
+# updates this without touching the database.
 
 st.subheader("📈 Test Market Demand")
 
-if st.button("📊 Calculate Demand"):
-    try:
-        demand_params = pd.read_csv(
-            os.path.join(
-                os.path.dirname(__file__),
-                "..",
-                "data",
-                "instructor_demand_competition.csv",
-            )
-        )
+try:
+    curves = demand_curves(catalog, avg_prices)
+    if round_number > 1 and not avg_prices:
+        st.info("ℹ️ No previous-round prices found — demand is computed without competition.")
 
-        # First round: no previous competition data
-        # First round: no previous competition data
-        if round_number == 1:
-            avg_prices_round = {}
-        else:
-            prev_round = round_number - 1
-        
-            # Load production plans for previous round
-            prev_plans_resp = (
-                supabase.table("production_plans")
-                .select("team_name, plan_json")
-                .eq("round_number", prev_round)
-                .execute()
-            )
-            prev_plans = prev_plans_resp.data or []
-        
-            produced_last_round = {}
-            for row in prev_plans:
-                team = row.get("team_name")
-                raw_plan = row.get("plan_json")
-        
-                try:
-                    plan_json = raw_plan if isinstance(raw_plan, list) else json.loads(raw_plan or "[]")
-                except Exception:
-                    plan_json = []
-        
-                cakes = {item.get("cake") for item in plan_json if "cake" in item}
-                produced_last_round[team] = cakes
-        
-            # Load prices but only keep those for cakes the team produced
-            prev_prices_resp = (
-                supabase.table("prices")
-                .select("team_name, prices_json")
-                .eq("round_number", prev_round)
-                .execute()
-            )
-            prev_prices_data = prev_prices_resp.data or []
-        
-            prev_rows = []
-            for rec in prev_prices_data:
-                team = rec.get("team_name")
-                raw_prices = rec.get("prices_json")
-        
-                try:
-                    prices_list = raw_prices if isinstance(raw_prices, list) else json.loads(raw_prices or "[]")
-                except Exception:
-                    prices_list = []
-        
-                for p in prices_list:
-                    cake = p.get("cake")
-                    channel = p.get("channel")
-                    if team in produced_last_round and cake in produced_last_round[team]:
-                        prev_rows.append({
-                            "team_name": team,
-                            "cake": cake,
-                            "channel": channel,
-                            "price_usd": p.get("price_usd", 0),
-                        })
-        
-            # Compute average
-            if prev_rows:
-                prev_prices_df = pd.DataFrame(prev_rows)
-                avg_prices_round = (
-                    prev_prices_df.groupby(["channel", "cake"])["price_usd"]
-                    .mean()
-                    .to_dict()
-                )
-            else:
-                avg_prices_round = {}
-                st.info("ℹ️ No previous-round prices found — using 0 as competitor baseline.")
-
-        results = []
-        for entry in pricing_entries:
-            cake = entry["cake"]
-            channel = entry["channel"]
-            my_price = entry["price_usd"]
-
-            params = demand_params[
-                (demand_params["cake_name"] == cake)
-                & (demand_params["channel"] == channel)
-            ]
-            if params.empty:
-                continue
+    what_if = curves.what_if(pricing_entries)
+    if what_if.empty:
+        st.info("Enter prices to see the expected demand.")
+    else:
+        st.dataframe(
+            pd.DataFrame({
+                "Cake": what_if["cake"],
+                "Channel": what_if["channel"],
+                "Your Price ($)": what_if["price_usd"],
+                "Prev-Round Avg ($)": [
+                    round(avg_prices[k], 2) if k in avg_prices else None
+                    for k in zip(what_if["channel"], what_if["cake"])
+                ],
+                "Expected Demand": what_if["demand"].astype(int),
+                "Profit if Sold ($)": what_if["profit"].round(2),
+            }),
+            hide_index=True,
+            use_container_width=True,
+        )
+        st.caption(
+            f"Profit if every demanded unit is made and sold: "
+            f"${what_if['profit'].sum():,.2f} (after transport and packaging, "
+            "before ingredients and labour)."
+        )
 
-            alpha = params["alpha"].values[0]
-            beta = params["beta"].values[0]
-            gamma = params["gamma_competition"].values[0]
+        with st.expander("📉 Demand & profit curve"):
+            options = {f"{cake} — {channel}": (channel, cake)
+                       for cake, channel in zip(what_if["cake"], what_if["channel"])}
+            selected = st.selectbox("Cake & channel", list(options))
+            st.line_chart(curves.curve(*options[selected]).set_index("price")[["demand", "profit"]])
 
-            avg_other = avg_prices_round.get((channel, cake), 0.0)
+except Exception as e:
+    st.error("❌ Failed to calculate demand.")
+    st.exception(e)
 
-            if round_number == 1:
-                D = max(0, alpha - beta * my_price)
-                D = math.floor(D)
-            else:
-                D = max(0, alpha - beta * my_price + gamma * (avg_other - my_price))
-                D = math.floor(D)
-            results.append(
-                {
-                    "Cake": cake,
-                    "Channel": channel,
-                    "Your Price ($)": my_price,
-                    "Prev-Round Avg ($)": round(avg_other, 2),
-                    "Expected Demand": round(D, 1),
-                }
+# =====================================
+# 🎲 DEMAND UNCERTAINTY (MONTE-CARLO)
+# =====================================
+# Recomputed on every edit of the price table while the toggle is on
+if st.toggle("🎲 Show demand uncertainty", key="demand_uncertainty",
+             help="Simulates random market noise around the expected demand."):
+    forecast = catalog.demand_model.forecast(pricing_entries, avg_prices)
+    if forecast.empty:
+        st.info("Enter prices to see the range of possible demand.")
+    else:
+        # Quantities of this round's plan, once one is submitted (NaN: not planned)
+        planned = plan_lines(reads.data("plan") or []).groupby(["cake", "channel"])["qty"].sum()
+        qty = np.array([planned.get(k, np.nan) for k in zip(forecast["cake"], forecast["channel"])], dtype=float)
+        sim = catalog.demand_model.simulate(
+            forecast["cake"], forecast["channel"], forecast["price_usd"], forecast["avg_price"],
+            qty if not planned.empty else None,
+        )
+        table = pd.DataFrame({
+            "Cake": forecast["cake"],
+            "Channel": forecast["channel"],
+            "Your Price ($)": forecast["price_usd"],
+            "Expected Demand": forecast["demand"].astype(int),
+            "Low (10%)": sim["demand_p10"].astype(int),
+            "Median": sim["demand_p50"].astype(int),
+            "High (90%)": sim["demand_p90"].astype(int),
+        })
+        if not planned.empty:
+            table["Planned Qty"] = qty
+            table["Expected Sold"] = sim["expected_sold"].round(1)
+            table["Chance to Sell Out"] = sim["sell_out"].where(~np.isnan(qty)).map(
+                lambda x: "" if pd.isna(x) else f"{x:.0%}"
             )
-
-        if results:
-            st.success("✅ Demand calculated successfully!")
-            st.dataframe(pd.DataFrame(results), use_container_width=True)
-        else:
-            st.warning("⚠️ No matching demand parameters found.")
-
-    except Exception as e:
-        st.error("❌ Failed to calculate demand.")
-        st.exception(e)
+        st.dataframe(table, hide_index=True, use_container_width=True)
+        st.caption(
+            "Real demand varies around the expected value: in 8 rounds out of 10 "
+            "it falls between Low and High."
+            + (" Expected Sold uses the quantities of your production plan for this round."
+               if not planned.empty else "")
+        )
 
 # =====================================
 # 💾 SAVE FINAL PRICES (ONE SUBMISSION PER ROUND, NO CONFIRMATION)
@@ -773,7 +618,7 @@ if st.button("📊 Calculate Demand"):
 if "saving_prices" not in st.session_state:
     st.session_state.saving_prices = False
 
-if submissions_locked(supabase):
+if submissions_locked():
     st.error("🚫 Submissions are locked by the instructor.")
 else:
     # disable button while saving OR if we've logically disabled submission
@@ -818,95 +663,19 @@ if st.session_state.saving_prices:
                 "auto_filled": False,
             }
 
-            supabase.table("prices").insert(payload).execute()
+            # Batched with other teams' submissions (see utils.write_queue)
+            submit_write("prices", payload, supabase=supabase).result(timeout=WRITE_TIMEOUT_SECONDS)
 
             # =====================================
             # 📈 CALCULATE & SAVE DEMAND FOR THIS ROUND
             # =====================================
 
-            # Load demand parameters
-            demand_params = pd.read_csv(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "..",
-                    "data",
-                    "instructor_demand_competition.csv",
-                )
-            )
-
-            # Load competitor prices (previous round)
-            if round_number == 1:
-                competitor_avg = {}
-            else:
-                prev_round = round_number - 1
-                prev_prices_data = (
-                    supabase.table("prices")
-                    .select("team_name, prices_json")
-                    .eq("round_number", prev_round)
-                    .execute()
-                    .data
-                )
-
-                prev_rows = []
-                for rec in prev_prices_data:
-                    prices_raw = rec["prices_json"]
-                    prices_list = prices_raw if isinstance(prices_raw, list) else json.loads(prices_raw)
-                    
-                    for p in prices_list:
-                        prev_rows.append(
-                            {
-                                "team_name": rec["team_name"],
-                                "channel": p["channel"],
-                                "cake": p["cake"],
-                                "price_usd": p["price_usd"],
-                            }
-                        )
-
-                if prev_rows:
-                    prev_df = pd.DataFrame(prev_rows)
-                    competitor_avg = (
-                        prev_df.groupby(["channel", "cake"])["price_usd"]
-                        .mean()
-                        .to_dict()
-                    )
-                else:
-                    competitor_avg = {}
-
-            # Compute demand for each (cake, channel) you priced
-            demand_results = []
-            for entry in pricing_entries:
-                cake = entry["cake"]
-                channel = entry["channel"]
-                my_price = entry["price_usd"]
-
-                params = demand_params[
-                    (demand_params["cake_name"] == cake)
-                    & (demand_params["channel"] == channel)
-                ]
-                if params.empty:
-                    continue
-
-                alpha = params["alpha"].values[0]
-                beta = params["beta"].values[0]
-                gamma = params["gamma_competition"].values[0]
-
-                avg_other = competitor_avg.get((channel, cake), 0.0)
-
-                if round_number == 1:
-                    D = max(0, alpha - beta * my_price)
-                else:
-                    D = max(
-                        0, alpha - beta * my_price + gamma * (avg_other - my_price)
-                    )
-                D = math.floor(D)
-
-                demand_results.append(
-                    {
-                        "cake": cake,
-                        "channel": channel,
-                        "demand": round(D, 1),
-                    }
-                )
+            # Same demand the live what-if table shows for these prices (see utils.demand)
+            forecast = catalog.demand_model.forecast(pricing_entries, avg_prices)
+            demand_results = [
+                {"cake": r.cake, "channel": r.channel, "demand": int(r.demand)}
+                for r in forecast.itertuples()
+            ]
 
             # Save into the demands table
             payload_demand = {
@@ -929,7 +698,7 @@ if st.session_state.saving_prices:
             if existing_demand:
                 st.warning("Demand for this round already exists; not overwriting.")
             else:
-                supabase.table("demands").insert(payload_demand).execute()
+                submit_write("demands", payload_demand, supabase=supabase).result(timeout=WRITE_TIMEOUT_SECONDS)
 
             st.success("✅ Final prices saved! You can’t edit them again this round.")
 
@@ -951,14 +720,7 @@ st.markdown("---")
 st.subheader("📜 Previous Price Submissions")
 
 try:
-    records = (
-        supabase.table("prices")
-        .select("*")
-        .eq("team_name", st.session_state.team_name)
-        .order("round_number", desc=True)
-        .execute()
-        .data
-    )
+    records = my_prices
 
     if records:
         # Only show manual submissions (not auto-filled placeholders)
@@ -8,53 +8,30 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import json
-import os
-from pathlib import Path
-from supabase import create_client
-from dotenv import load_dotenv
 from datetime import datetime
 import math
 import pytz
 
+from utils.catalog import get_catalog
+from utils.competitor_prices import competitor_prices, competitor_prices_query
+from utils.db import get_client, get_current_round, read_concurrently, submissions_locked
+from utils.editor_tables import plan_table, read_plan_table
+from utils.query_trace import start_trace
+from utils.write_queue import WRITE_TIMEOUT_SECONDS, submit_write
+
 BEIRUT_TZ = pytz.timezone("Asia/Beirut")
 
 # =====================================
 # 🌍 SUPABASE SETUP
 # =====================================
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
+try:
+    supabase = get_client()
+except RuntimeError:
     st.error("❌ Missing Supabase credentials.")
     st.stop()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 st.set_page_config(page_title="Production Plan", page_icon="🍰", layout="wide")
-
-
-def submissions_locked(supabase_client):
-    lock_row = (
-        supabase_client.table("game_state")
-        .select("value")
-        .eq("key", "locked")
-        .single()
-        .execute()
-    )
-    return lock_row.data and lock_row.data["value"] == "true"
-
-
-def get_current_round():
-    resp = (
-        supabase.table("game_state")
-        .select("value")
-        .eq("key", "current_round")
-        .single()
-        .execute()
-    )
-    return int(resp.data["value"])
+start_trace("ProductionPlan")
 
 
 # =====================================
@@ -71,13 +48,56 @@ if "logged_in" not in st.session_state or not st.session_state.logged_in:
 current_round = get_current_round()
 team = st.session_state.team_name
 
-submitted_rounds_resp = (
-    supabase.table("production_plans")
-    .select("round_number")
-    .eq("team_name", team)
-    .execute()
+
+def inventory_query(category):
+    return (
+        supabase.table("inventory")
+        .select("resource_name, quantity")
+        .eq("team_name", team)
+        .eq("category", category)
+    )
+
+
+def latest_for_round(table, round_num):
+    return (
+        supabase.table(table)
+        .select("*")
+        .eq("team_name", team)
+        .eq("round_number", round_num)
+        .order("id", desc=True)
+        .limit(1)
+    )
+
+
+def round_queries(round_num):
+    """
+    The round's prices and demand, plus the competitor averages the demand
+    forecast was based on while the uncertainty view is shown.
+    """
+    show_avg = round_num > 1 and st.session_state.get("show_uncertainty", False)
+    return {
+        "prices": latest_for_round("prices", round_num),
+        "demands": latest_for_round("demands", round_num),
+        "prev_avg": competitor_prices_query(supabase, round_num - 1) if show_avg else None,
+    }
+
+
+# Plan history and stock don't depend on the selected round; once the
+# round is known (every rerun after the first) its reads join the same wave
+known_round = st.session_state.get("round")
+reads = read_concurrently(
+    history=(
+        supabase.table("production_plans")
+        .select("*")
+        .eq("team_name", team)
+        .order("round_number", desc=True)
+    ),
+    ingredient_stock=inventory_query("ingredient"),
+    capacity_stock=inventory_query("capacity"),
+    **(round_queries(known_round) if known_round is not None else {}),
 )
-submitted_rounds = {r["round_number"] for r in submitted_rounds_resp.data}
+history = reads.data("history") or []
+submitted_rounds = {r["round_number"] for r in history}
 
 # Next unsubmitted round defaults in the selector
 if "round" not in st.session_state:
@@ -90,6 +110,9 @@ if "round" not in st.session_state:
 
 selected_round = st.session_state.round
 
+# This round's prices and demand, fetched while the page is built
+round_reads = reads if known_round is not None else read_concurrently(**round_queries(selected_round))
+
 # =====================================
 # 🎨 PAGE STYLING
 # =====================================
@@ -304,22 +327,15 @@ st.write(f"Welcome, **{team}**!")
 # 🧾 LOAD DATA
 # ======================================
 try:
-    cakes_df = pd.DataFrame(supabase.table("cakes").select("*").execute().data)
-    channels_df = pd.DataFrame(
-        supabase.table("channels").select("channel").execute().data
-    )
+    catalog = get_catalog()
 except Exception as e:
     st.error("❌ Failed to load cakes or channels data.")
     st.exception(e)
     st.stop()
 
-channels = channels_df["channel"].tolist()
-
-
-# NEW: Packaging cost map
-cakes_resp = supabase.table("cakes").select("name, packaging_cost_per_unit_usd").execute()
-cakes_df2 = pd.DataFrame(cakes_resp.data or [])
-packaging_map = dict(zip(cakes_df2["name"], cakes_df2["packaging_cost_per_unit_usd"]))
+cakes_df = catalog.cakes
+channels = list(catalog.channel_names)
+packaging_map = catalog.packaging_cost
 
 # ======================================
 # ⏱️ Normalize time units to hours
@@ -331,21 +347,14 @@ for col in ["oven_min_per_batch", "prep_min_per_unit", "pack_min_per_unit"]:
 # ======================================
 # 📦 INVENTORY
 # ======================================
-def get_inventory(team_name, category):
-    data = (
-        supabase.table("inventory")
-        .select("resource_name, quantity")
-        .eq("team_name", team_name)
-        .eq("category", category)
-        .execute()
-        .data
-    )
+def get_inventory(category):
+    data = reads.data(f"{category}_stock") or []
     # keys lowercased for comparisons
     return {d["resource_name"].lower(): d["quantity"] for d in data}
 
 
-ingredient_stock = get_inventory(team, "ingredient")
-capacity_totals = get_inventory(team, "capacity")
+ingredient_stock = get_inventory("ingredient")
+capacity_totals = get_inventory("capacity")
 
 # ======================================
 # 📝 BUILD PRODUCTION TABLE
@@ -370,20 +379,11 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-rows = []
-for _, cake_row in cakes_df.iterrows():
-    cake_name = cake_row["name"]
-    min_units = int(cake_row["minimum_units_if_made"])
-    row = {"Cake (min qty)": f"{cake_name} (min {min_units})"}
-    for ch in channels:
-        row[ch] = 0
-    rows.append(row)
-
-production_table = pd.DataFrame(rows)
+min_batch = dict(zip(cakes_df["name"], cakes_df["minimum_units_if_made"].astype(int)))
+production_table = plan_table(min_batch, channels)
 
 # 🔄 FORCE RESET AFTER SUBMISSION
 if st.session_state.get("force_reset_prod"):
-    production_table = pd.DataFrame(rows)
     st.session_state.force_reset_prod = False
 
 editor_key = f"prod_editor_{st.session_state.get('editor_version', 0)}"
@@ -407,22 +407,7 @@ edited_plan = st.data_editor(
 # ======================================
 # 🔄 Convert wide → long & apply min batch rules
 # ======================================
-plan_entries = []
-violations = []
-min_batch = {r["name"]: int(r["minimum_units_if_made"]) for _, r in cakes_df.iterrows()}
-
-for _, row in edited_plan.iterrows():
-    cake = row["Cake (min qty)"].split(" (min")[0].strip()
-    min_req = min_batch[cake]
-    total_qty = sum(row[ch] for ch in channels)
-
-    if 0 < total_qty < min_req:
-        violations.append((cake, min_req))
-
-    for ch in channels:
-        qty = row[ch]
-        if qty > 0:
-            plan_entries.append({"cake": cake, "channel": ch, "qty": qty})
+plan_entries, violations = read_plan_table(edited_plan, channels, min_batch)
 
 batch_ok = len(violations) == 0
 
@@ -438,16 +423,8 @@ if not plan_df.empty:
 # ======================================
 # 💰 LOAD PRICES & DEMAND FOR THIS ROUND
 # ======================================
-def get_json(table, round_num):
-    resp = (
-        supabase.table(table)
-        .select("*")
-        .eq("team_name", team)
-        .eq("round_number", round_num)
-        .order("id", desc=True)
-        .limit(1)
-        .execute()
-    )
+def get_json(table):
+    resp = round_reads.response(table)
     if resp.data:
         raw = resp.data[0]
         key = "prices_json" if table == "prices" else "demands_json"
@@ -462,8 +439,8 @@ def get_json(table, round_num):
     return pd.DataFrame()
 
 
-price_df = get_json("prices", selected_round)
-demand_df = get_json("demands", selected_round)
+price_df = get_json("prices")
+demand_df = get_json("demands")
 
 if price_df.empty:
     st.error("❌ You must submit final prices for this round before planning production.")
@@ -505,24 +482,11 @@ if not plan_df.empty:
         required["package"] += qty * r["pack_min_per_unit"]
 
 # Ingredient requirements
-recipes = pd.DataFrame(supabase.table("recipes").select("*").execute().data)
-recipes.columns = [c.lower() for c in recipes.columns]
+recipes = catalog.recipes
 
 
 def compute_needs(plan_df_):
-    needs = {}
-    totals = plan_df_.groupby("cake")["qty"].sum().to_dict()
-    for cake, qty in totals.items():
-        rec = recipes[recipes["name"].str.lower() == cake.lower()]
-        if rec.empty:
-            continue
-        row = rec.iloc[0]
-        for ing in row.index:
-            if ing in ["id", "cake_id", "name", "created_at"]:
-                continue
-            amt = qty * float(row[ing])
-            needs[ing] = needs.get(ing, 0) + amt
-    return needs
+    return recipes.needs(plan_df_.groupby("cake")["qty"].sum())
 
 
 ingredient_needs = compute_needs(plan_df) if not plan_df.empty else {}
@@ -670,18 +634,42 @@ elif not batch_ok:
 else:
     st.success("✅ Feasible plan!")
 
+# ======================================
+# 🎲 DEMAND UNCERTAINTY (MONTE-CARLO)
+# ======================================
+if not merged.empty and st.toggle("🎲 Show demand uncertainty", key="show_uncertainty",
+                                  help="Simulates random market noise around the expected demand."):
+    try:
+        stored_avg = round_reads.data("prev_avg")
+    except Exception:
+        stored_avg = []  # not stored: computed live
+    avg_prices = competitor_prices(supabase, selected_round - 1, stored_avg)
+    avg = [avg_prices.get(k, np.nan) for k in zip(merged["channel"], merged["cake"])]
+
+    sim = catalog.demand_model.simulate(
+        merged["cake"], merged["channel"], merged["price"], avg, merged["qty"]
+    )
+    st.dataframe(
+        pd.DataFrame({
+            "Cake": merged["cake"],
+            "Channel": merged["channel"],
+            "Qty": merged["qty"].astype(int),
+            "Expected Demand": merged["demand"].astype(int),
+            "Expected Sold": sim["expected_sold"].round(1),
+            "Chance to Sell Out": sim["sell_out"].map(lambda x: "" if pd.isna(x) else f"{x:.0%}"),
+        }),
+        hide_index=True,
+        use_container_width=True,
+    )
+    st.caption(
+        "Expected Sold averages many simulated markets: when demand falls short "
+        "of your quantity, the extra units stay unsold."
+    )
+
 # ======================================
 # 🔒 CHECK IF ALREADY SUBMITTED THIS ROUND
 # ======================================
-already_submitted = (
-    supabase.table("production_plans")
-    .select("id")
-    .eq("team_name", team)
-    .eq("round_number", selected_round)
-    .execute()
-    .data
-)
-locked = bool(already_submitted)
+locked = selected_round in submitted_rounds
 
 # ======================================
 # 💾 SAFE SUBMIT PRODUCTION PLAN
@@ -692,7 +680,7 @@ if "saving_plan" not in st.session_state:
     st.session_state.saving_plan = False
 
 # Check lock
-if submissions_locked(supabase):
+if submissions_locked():
     st.error("🚫 Submissions are locked by the instructor.")
 
 else:
@@ -720,9 +708,9 @@ else:
 # ======================================
 if st.session_state.saving_plan:
     try:
-        # 🚀 One atomic RPC call (you will add this RPC)
-        supabase.rpc(
-            "save_production_plan_atomic",
+        # 🚀 Atomic per plan, batched with other teams' plans (see utils.write_queue)
+        submit_write(
+            "production_plan",
             {
                 "p_team_name": team,
                 "p_round": selected_round,
@@ -731,8 +719,9 @@ if st.session_state.saving_plan:
                 "p_required": required,
                 "p_ing_used": ingredient_needs,
                 "p_cap_used": required,
-            }
-        ).execute()
+            },
+            supabase=supabase,
+        ).result(timeout=WRITE_TIMEOUT_SECONDS)
 
         st.success("✅ Production plan submitted and stock updated!")
 
@@ -756,15 +745,6 @@ if st.session_state.saving_plan:
 st.markdown("---")
 st.subheader("📜 Previous Production Plans")
 
-history = (
-    supabase.table("production_plans")
-    .select("*")
-    .eq("team_name", team)
-    .order("round_number", desc=True)
-    .execute()
-    .data
-)
-
 for r in history:
     with st.expander(
         f"Round {r['round_number']} — Expected Profit ${r['profit_usd']:,.2f}"
@@ -5,43 +5,24 @@ Leaderboard Page - Cake Simulation (Round-based)
 
 import streamlit as st
 import pandas as pd
-import os
-from supabase import create_client
-from dotenv import load_dotenv
-from pathlib import Path
+
+from utils.db import get_client, get_current_round, list_teams
+from utils.query_trace import start_trace
 
 
 st.set_page_config(page_title="🏆 Leaderboard", page_icon="🥇", layout="wide")
+start_trace("Leaderboard")
 
 
 # =====================================
-# 🌍 LOAD ENV
+# 🌍 SUPABASE CLIENT
 # =====================================
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
+try:
+    supabase = get_client()
+except RuntimeError:
     st.error("❌ Missing Supabase credentials. Check .env file.")
     st.stop()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# =====================================
-# 🎯 ROUND BANNER
-# =====================================
-def get_current_round():
-    response = (
-        supabase.table("game_state")
-        .select("value")
-        .eq("key", "current_round")
-        .single()
-        .execute()
-    )
-    return int(response.data["value"])
-
 
 # =====================================
 # 🔄 CURRENT ROUND
@@ -295,8 +276,7 @@ st.markdown(f"📊 Showing results up to **Round {current_round}**")
 # 📊 LOAD LEADERBOARD DATA
 # =====================================
 try:
-    response = supabase.table("teams").select("*").execute()
-    teams = pd.DataFrame(response.data)
+    teams = pd.DataFrame(list_teams())
 
     if teams.empty:
         st.info("No team data found yet.")
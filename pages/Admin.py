@@ -1,4 +1,3 @@
-
 # -*- coding: utf-8 -*-
 """
 Admin Control Panel — Cake Simulation (Round-based)
@@ -7,42 +6,31 @@ Admin Control Panel — Cake Simulation (Round-based)
 import streamlit as st
 import pandas as pd
 import os
+import time
 from datetime import datetime
-from supabase import create_client
-from dotenv import load_dotenv
-from pathlib import Path
+from utils.catalog import get_catalog, invalidate_catalog
+from utils.db import get_client, get_current_round, set_current_round, set_submissions_locked, submissions_locked
+from utils.equilibrium import solve_equilibrium, team_costs
+from utils.finalize_games import advance_round
+from utils.finalize_job import get_finalize_job, list_finalize_jobs, start_finalize_job
 from utils.finalize_round import finalize_round
+from utils.http_client import pool_stats
+from utils.query_trace import start_trace
+from utils.write_queue import queue_stats
 
 
-
+start_trace("Admin")
 
 
 # =====================================
-# LOAD ENV + SUPABASE
+# SUPABASE (shared client; utils.db also loads .env)
 # =====================================
-env_path = Path(__file__).parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
+try:
+    supabase = get_client()
+except RuntimeError:
     st.error("❌ Missing Supabase credentials.")
     st.stop()
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# =====================================
-# GET/SET CURRENT ROUND
-# =====================================
-def get_current_round():
-    resp = supabase.table("game_state").select("value").eq("key", "current_round").single().execute()
-    return int(resp.data["value"])
-
-def set_current_round(new_round: int):
-    supabase.table("game_state").update({"value": str(new_round)}).eq("key", "current_round").execute()
-
 
 # =====================================
 # ADMIN LOGIN CHECK
@@ -83,17 +71,196 @@ st.markdown("---")
 # =====================================
 st.subheader("➡️ Advance to Next Round")
 
-if st.button("📈 Move to Round " + str(current_round + 1)):
-    finalize_round(current_round)
-    new_round = current_round + 1
-    set_current_round(new_round)
-    supabase.table("teams") \
-    .update({"round_number": new_round}) \
-    .neq("team_name", "") \
-    .execute()
+job = get_finalize_job(current_round)
+previous_job = get_finalize_job(current_round - 1)
 
-    st.success(f"Successfully advanced to Round {current_round + 1}.")
-    st.rerun()
+# Announce the advance once, not on every later rerun of the page
+if (
+    previous_job is not None
+    and previous_job.status == "done"
+    and st.session_state.get("advance_announced") != current_round
+):
+    st.success(f"Successfully advanced to Round {current_round}.")
+    st.session_state.advance_announced = current_round
+
+
+@st.fragment(run_every=1)
+def finalize_progress(job):
+    """Polls the background finalization without rerunning the whole page."""
+    if not job.active:
+        # Full rerun: the page picks up the new round or the failure
+        st.rerun()
+    status = job.snapshot()
+    total = status["teams_total"]
+    done = status["teams_done"]
+    st.info(f"⏳ Finalizing Round {job.round_number} in the background — {done}/{total or '?'} teams settled.")
+    st.progress(done / total if total else 0.0)
+
+
+if job is not None and job.active:
+    finalize_progress(job)
+else:
+    if job is not None and job.status == "failed":
+        st.error(
+            f"❌ Finalizing Round {current_round} failed. Teams already settled keep their results; "
+            "click the button again to resume."
+        )
+        with st.expander("Error details"):
+            st.code(job.snapshot()["error"])
+
+    if st.button("📈 Move to Round " + str(current_round + 1)):
+        # advance_round runs in the worker once every team is settled
+        start_finalize_job(current_round, on_success=lambda r: advance_round(supabase, r))
+        st.rerun()
+
+# =====================================
+# 🔍 SETTLEMENT PREVIEW (DRY RUN)
+# =====================================
+st.subheader("🔍 Settlement Preview")
+
+def submissions_fingerprint(round_number: int):
+    """Row counts of this round's submissions; changes whenever a team submits."""
+    return tuple(
+        supabase.table(table)
+        .select("round_number", count="exact")
+        .eq("round_number", round_number)
+        .limit(1)
+        .execute()
+        .count
+        for table in ("prices", "production_plans", "investments")
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def settlement_preview(round_number: int, fingerprint):
+    return finalize_round(round_number, dry_run=True)
+
+
+if st.checkbox(f"Show projected results for Round {current_round}"):
+    try:
+        preview = settlement_preview(current_round, submissions_fingerprint(current_round))
+        st.dataframe(
+            preview.rename(columns={
+                "team_name": "Team",
+                "last_profit": "Profit",
+                "last_transport_cost": "Transport",
+                "last_packaging_cost": "Packaging",
+                "last_resource_cost": "Resource Cost",
+                "money": "Cash After",
+                "stock_value": "Stock After",
+                "total_value": "Total Value After",
+            }),
+            use_container_width=True,
+        )
+        timings = preview.attrs.get("timings", {})
+        st.caption(
+            "Dry run — nothing is written until the round is advanced. "
+            f"Computed in {timings.get('total_seconds', 0):.2f}s with {timings.get('round_trips', 0)} round-trips."
+        )
+    except Exception as e:
+        st.error("Failed to compute settlement preview.")
+        st.exception(e)
+
+# =====================================
+# ⚖️ MARKET EQUILIBRIUM
+# =====================================
+st.subheader("⚖️ Market Equilibrium")
+st.caption(
+    "Prices a cohort settles on when every team keeps best-responding to the others — "
+    "a check of the demand parameters before a semester."
+)
+
+eq_col1, eq_col2 = st.columns(2)
+eq_teams = eq_col1.number_input("Teams", min_value=1, max_value=5000, value=200, step=10)
+eq_spread = eq_col2.slider("Unit cost spread between teams (±%)", 0, 50, 0, step=5)
+
+if st.button("⚖️ Solve Equilibrium"):
+    eq_catalog = get_catalog()
+    eq_costs = team_costs(eq_catalog, [f"team {i + 1}" for i in range(int(eq_teams))], spread=eq_spread / 100)
+    st.session_state.equilibrium = solve_equilibrium(eq_catalog, eq_costs)
+
+equilibrium = st.session_state.get("equilibrium")
+if equilibrium is not None:
+    market = equilibrium.market()
+    st.dataframe(
+        market.rename(columns={
+            "cake": "Cake",
+            "channel": "Channel",
+            "max_price": "Cap ($)",
+            "avg_price": "Avg Price ($)",
+            "min_price": "Lowest ($)",
+            "top_price": "Highest ($)",
+            "demand": "Demand / Team",
+            "margin": "Margin ($)",
+            "profit": "Profit / Team ($)",
+            "regret": "Regret / Team ($)",
+            "at_cap": "At Cap",
+            "no_sales": "No Sales",
+        }).round(2),
+        use_container_width=True,
+        hide_index=True,
+    )
+    status = "converged" if equilibrium.converged else f"stopped ${equilibrium.gap:.2f} from converging"
+    st.caption(
+        f"{len(equilibrium.teams)} teams, {status} after {equilibrium.iterations} iterations "
+        f"in {equilibrium.seconds:.2f}s. Regret is what one team could still gain on a pair by re-pricing alone."
+    )
+
+    for mask, message in (
+        (market["at_cap"], "priced at the cap by every team"),
+        (market["no_sales"], "without any sales"),
+        (market["profit"] <= 0, "not profitable"),
+    ):
+        flagged = market[mask]
+        if not flagged.empty:
+            st.warning(f"{len(flagged)} pair(s) {message}: " + ", ".join(flagged["cake"] + " / " + flagged["channel"]))
+
+# =====================================
+# ⏱️ FINALIZATION TIMINGS
+# =====================================
+timing_reports = [j.snapshot()["report"] for j in list_finalize_jobs()]
+timing_reports = [r for r in timing_reports if r]
+
+if timing_reports:
+    st.subheader("⏱️ Finalization Timings")
+    timing_rows = []
+    for report in timing_reports:
+        row = {
+            "Round": report["round_number"],
+            "Teams": report["teams"],
+            "Total (s)": round(report["total_seconds"], 3),
+            "Round-trips": report["round_trips"],
+        }
+        for phase in report["phases"]:
+            row[f"{phase['phase']} (s)"] = round(phase["seconds"], 3)
+            row[f"{phase['phase']} (trips)"] = phase["round_trips"]
+        timing_rows.append(row)
+    st.dataframe(pd.DataFrame(timing_rows), use_container_width=True, hide_index=True)
+
+# =====================================
+# 🌐 CONNECTION POOL
+# =====================================
+pools = pool_stats()
+if pools:
+    st.subheader("🌐 Connection Pool")
+    pool = pools[0]
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("In flight", f"{pool['in_flight']} / {pool['max_connections']}")
+    c2.metric("Peak saturation", f"{pool['peak_saturation']:.0%}")
+    c3.metric("Retries", pool["retries"])
+    c4.metric("Failures", pool["failures"], help=f"{pool['pool_timeouts']} pool timeouts")
+    st.caption(
+        f"{pool['requests']} requests since start. Saturation above 100% means "
+        "requests queued for a free connection."
+    )
+
+queues = queue_stats()
+if queues:
+    queue = queues[0]
+    st.caption(
+        f"📮 Write queue: {queue['submissions']} submissions in {queue['batches']} batches "
+        f"(largest {queue['largest_batch']}), {queue['pending']} pending, {queue['failures']} refused."
+    )
 
 # =====================================
 # ⬅️ REOPEN PREVIOUS ROUND
@@ -116,19 +283,18 @@ st.markdown("---")
 
 st.subheader("🔐 Control Submissions")
 
-lock_state = supabase.table("game_state").select("value").eq("key", "locked").single().execute()
-locked = lock_state.data["value"] == "true" if lock_state.data else False
+locked = submissions_locked()
 
 if locked:
     st.success("Submissions are currently **LOCKED**.")
     if st.button("🔓 Unlock Submissions"):
-        supabase.table("game_state").update({"value": "false"}).eq("key", "locked").execute()
+        set_submissions_locked(False)
         st.success("Submissions unlocked.")
         st.rerun()
 else:
     st.warning("Submissions are currently **OPEN**.")
     if st.button("🔒 Lock Submissions"):
-        supabase.table("game_state").update({"value": "true"}).eq("key", "locked").execute()
+        set_submissions_locked(True)
         st.success("Submissions locked.")
         st.rerun()
 
@@ -180,6 +346,7 @@ if st.button("❗ Delete All Data for This Round"):
         supabase.table("demands").delete().eq("round_number", reset_round).execute()
         supabase.table("production_plans").delete().eq("round_number", reset_round).execute()
         supabase.table("investments").delete().eq("round_number", reset_round).execute()
+        supabase.table("competitor_prices").delete().eq("round_number", reset_round).execute()
         st.success(f"All data for round {reset_round} has been cleared.")
     except Exception as e:
         st.error("Failed to reset round.")
@@ -187,6 +354,25 @@ if st.button("❗ Delete All Data for This Round"):
 
 st.markdown("---")
 
+# =====================================
+# 📚 REFERENCE DATA
+# =====================================
+st.subheader("📚 Reference Data")
+
+catalog = get_catalog()
+st.caption(
+    f"Cakes, channels, recipes and the data/ CSVs are cached for every page: "
+    f"{len(catalog.cake_names)} cakes, {len(catalog.channel_names)} channels, "
+    f"loaded {int(time.monotonic() - catalog.loaded_at)}s ago."
+)
+
+if st.button("♻️ Reload Reference Data"):
+    invalidate_catalog()
+    st.success("Reference data will be reloaded on the next page load.")
+    st.rerun()
+
+st.markdown("---")
+
 
 
 # =====================================
@@ -0,0 +1,16 @@
+-- Competitor price averages per finalized round.
+--
+-- Written by utils/finalize_round.py when a round closes: the mean price
+-- per (channel, cake) over the teams that produced that cake, i.e. the
+-- averages settlement used. The Demand page reads the previous round's
+-- rows (a few dozen numbers) instead of every team's plans and prices.
+-- Re-finalizing a round replaces its rows; resetting it in the Admin
+-- panel deletes them.
+
+create table if not exists public.competitor_prices (
+    round_number int not null,
+    channel text not null,
+    cake text not null,
+    avg_price numeric not null,
+    primary key (round_number, channel, cake)
+);
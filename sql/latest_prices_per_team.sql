@@ -0,0 +1,26 @@
+-- Latest price submission per team, up to and including a round.
+--
+-- Used by utils/finalize_round.py so round close reads exactly one
+-- `prices` row per team, however many rounds have been played. The
+-- lateral lookup walks the index once per team instead of scanning the
+-- full price history.
+
+create index if not exists prices_team_round_idx
+    on public.prices (team_name, round_number desc, id desc);
+
+create or replace function public.latest_prices_per_team(p_round int)
+returns setof public.prices
+language sql
+stable
+as $$
+    select p.*
+    from public.teams t
+    cross join lateral (
+        select *
+        from public.prices
+        where prices.team_name = t.team_name
+          and prices.round_number <= p_round
+        order by prices.round_number desc, prices.id desc
+        limit 1
+    ) p;
+$$;
@@ -0,0 +1,52 @@
+-- Batched team settlement for round close.
+--
+-- Used by utils/finalize_round.py for each checkpoint batch. Money and
+-- stock change by the round's profit and resource cost relative to the
+-- row as it is when the batch lands, not as finalize_round read it, so
+-- purchases and other writes saved while the round was being settled are
+-- kept. Only the settled columns are written. A team whose
+-- last_finalized_round already equals p_round is skipped, so a retried
+-- batch is never applied twice.
+--
+-- p_teams is a JSON array of {"team_name", "profit", "resource_cost",
+-- "transport", "packaging"} objects; teams without a production plan send
+-- only "team_name" and are carried forward unchanged. Returns the names
+-- of the teams updated.
+
+create or replace function public.settle_teams_batch(p_round int, p_teams jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    item jsonb;
+    settled jsonb := '[]'::jsonb;
+    v_profit numeric;
+    v_cost numeric;
+begin
+    for item in select value from jsonb_array_elements(p_teams)
+    loop
+        v_profit := coalesce((item->>'profit')::numeric, 0);
+        v_cost := (item->>'resource_cost')::numeric;
+
+        update public.teams t
+        set money = t.money + v_profit,
+            stock_value = case when v_cost is null then t.stock_value
+                               else greatest(t.stock_value - v_cost, 0) end,
+            total_value = t.money + v_profit
+                          + case when v_cost is null then t.stock_value
+                                 else greatest(t.stock_value - v_cost, 0) end,
+            last_profit = coalesce((item->>'profit')::numeric, t.last_profit),
+            last_transport_cost = coalesce((item->>'transport')::numeric, t.last_transport_cost),
+            last_resource_cost = coalesce(v_cost, t.last_resource_cost),
+            last_packaging_cost = coalesce((item->>'packaging')::numeric, t.last_packaging_cost),
+            last_finalized_round = p_round
+        where t.team_name = item->>'team_name'
+          and t.last_finalized_round is distinct from p_round;
+
+        if found then
+            settled := settled || jsonb_build_array(item->>'team_name');
+        end if;
+    end loop;
+    return settled;
+end;
+$$;
@@ -0,0 +1,73 @@
+-- Batched submission RPCs.
+--
+-- Used by utils/write_queue.py, which collects the investment and
+-- production plan submissions of many sessions and sends them as one
+-- call. Each item runs the existing single-submission function in its
+-- own subtransaction (the inner begin/exception block), so a refused
+-- submission (insufficient funds, duplicate plan, ...) is reported in
+-- its own result entry and does not roll back the rest of the batch.
+--
+-- p_items is a JSON array of the parameter objects the pages used to
+-- send to save_investment_atomic / save_production_plan_atomic. Both
+-- functions return one {"ok": true, "result": ...} or {"ok": false,
+-- "error": "..."} entry per item, in order; "result" is what the single
+-- function returned, so a batched submission resolves to the same value
+-- as one sent on its own.
+
+create or replace function public.save_investments_batch(p_items jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    item jsonb;
+    v_result jsonb;
+    results jsonb := '[]'::jsonb;
+begin
+    for item in select value from jsonb_array_elements(p_items)
+    loop
+        begin
+            v_result := to_jsonb(public.save_investment_atomic(
+                p_team_name   => item->>'p_team_name',
+                p_round       => (item->>'p_round')::int,
+                p_ingredients => item->'p_ingredients',
+                p_capacity    => item->'p_capacity',
+                p_total       => (item->>'p_total')::numeric
+            ));
+            results := results || jsonb_build_array(jsonb_build_object('ok', true, 'result', v_result));
+        exception when others then
+            results := results || jsonb_build_array(jsonb_build_object('ok', false, 'error', sqlerrm));
+        end;
+    end loop;
+    return results;
+end;
+$$;
+
+create or replace function public.save_production_plans_batch(p_items jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    item jsonb;
+    v_result jsonb;
+    results jsonb := '[]'::jsonb;
+begin
+    for item in select value from jsonb_array_elements(p_items)
+    loop
+        begin
+            v_result := to_jsonb(public.save_production_plan_atomic(
+                p_team_name => item->>'p_team_name',
+                p_round     => (item->>'p_round')::int,
+                p_plan      => item->'p_plan',
+                p_profit    => (item->>'p_profit')::numeric,
+                p_required  => item->'p_required',
+                p_ing_used  => item->'p_ing_used',
+                p_cap_used  => item->'p_cap_used'
+            ));
+            results := results || jsonb_build_array(jsonb_build_object('ok', true, 'result', v_result));
+        exception when others then
+            results := results || jsonb_build_array(jsonb_build_object('ok', false, 'error', sqlerrm));
+        end;
+    end loop;
+    return results;
+end;
+$$;
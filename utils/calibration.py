@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+Demand Calibration — Cake Simulation
+
+Fits alpha, beta and gamma of instructor_demand_competition.csv to the
+demand teams were shown in past rounds. Each `demands` row is paired with
+the team's `prices` row of the same round and with the competitor averages
+the Demand page forecast with: those of the previous round, from its
+prices and `production_plans` (utils.settlement.competitor_avg_prices).
+
+Per (cake, channel), the shared rule (utils.demand) is linear in the
+parameters before floor and clamp,
+
+    D + 0.5 ≈ alpha - beta * p + gamma * (avg - p),
+
+so the least-squares fit only needs the running sums X'X, X'y and y'y.
+Rows are read in pages of PAGE_SIZE (`.range` requests) one round at a
+time and folded into those sums, so memory holds one page and one round's
+prices and plans however long the history is, and several games
+(semesters or sections, see utils.db.get_client) add into the same sums.
+The +0.5 undoes the floor on average; zero demand is left out, as the
+clamp hides how far below zero it was.
+
+A pair keeps its current parameters without MIN_OBSERVATIONS points;
+gamma keeps its current value when competitor averages never moved apart
+from prices (e.g. round 1 only), and fits with beta <= 0 or gamma < 0 are
+rejected.
+
+Run from the repository root:
+
+    python -m utils.calibration
+    python -m utils.calibration section_a section_b --out calibration
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.catalog import DATA_DIR
+from utils.db import get_client
+from utils.demand import average_prices
+from utils.settlement import competitor_avg_prices, demand_lines, plan_lines, price_lines
+
+
+PAGE_SIZE = 1000
+MIN_OBSERVATIONS = 10
+PARAMETERS = ["alpha", "beta", "gamma_competition"]
+CANDIDATE_FILE = "instructor_demand_competition.csv"
+DIAGNOSTICS_FILE = "calibration_diagnostics.csv"
+
+
+# =====================================
+# 📥 PAGED READS
+# =====================================
+def paged(make_query, page_size=PAGE_SIZE):
+    """Pages (lists of rows) of the query `make_query()` builds, in id order."""
+    start = 0
+    while True:
+        rows = make_query().order("id").range(start, start + page_size - 1).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+
+# =====================================
+# ➕ NORMAL EQUATIONS
+# =====================================
+class NormalEquations:
+    """Running least-squares sums per (cake, channel) for the demand rule."""
+
+    def __init__(self):
+        self.rows = {}
+        self.xtx = np.zeros((0, 3, 3))
+        self.xty = np.zeros((0, 3))
+        self.yty = np.zeros(0)
+        self.n = np.zeros(0, dtype=int)
+
+    def _index(self, cakes, channels):
+        rows = self.rows
+        index = np.fromiter((rows.setdefault(key, len(rows)) for key in zip(cakes, channels)), dtype=int)
+        grow = len(rows) - len(self.n)
+        if grow:
+            self.xtx = np.concatenate([self.xtx, np.zeros((grow, 3, 3))])
+            self.xty = np.concatenate([self.xty, np.zeros((grow, 3))])
+            self.yty = np.concatenate([self.yty, np.zeros(grow)])
+            self.n = np.concatenate([self.n, np.zeros(grow, dtype=int)])
+        return index
+
+    def add(self, cakes, channels, prices, avg_prices, demand):
+        """Fold in observations; NaN averages mean no competition."""
+        price = np.asarray(prices, dtype=float)
+        avg = np.asarray(avg_prices, dtype=float)
+        demand = np.asarray(demand, dtype=float)
+        keep = (demand > 0) & np.isfinite(price)
+        if not keep.any():
+            return
+
+        price, avg, demand = price[keep], avg[keep], demand[keep]
+        x = np.column_stack([np.ones(len(price)), -price, np.where(np.isnan(avg), 0.0, avg - price)])
+        y = demand + 0.5
+        i = self._index(np.asarray(cakes)[keep], np.asarray(channels)[keep])
+
+        np.add.at(self.xtx, i, x[:, :, None] * x[:, None, :])
+        np.add.at(self.xty, i, x * y[:, None])
+        np.add.at(self.yty, i, y * y)
+        np.add.at(self.n, i, 1)
+
+    def stats(self, cakes, channels):
+        """(X'X, X'y, y'y, n) aligned with the given pairs; zeros where unseen."""
+        # Unseen pairs point at an extra all-zero row
+        j = np.array([self.rows.get(key, len(self.n)) for key in zip(cakes, channels)], dtype=int)
+        pad = lambda a: np.concatenate([a, np.zeros((1,) + a.shape[1:], dtype=a.dtype)])
+        return pad(self.xtx)[j], pad(self.xty)[j], pad(self.yty)[j], pad(self.n)[j]
+
+
+def accumulate(supabase, equations, page_size=PAGE_SIZE):
+    """
+    Fold every round of one game into `equations`. Returns the number of
+    rounds read and of demand observations found.
+    """
+    last = (
+        supabase.table("demands").select("round_number")
+        .order("round_number", desc=True).limit(1).execute().data
+    )
+    rounds = last[0]["round_number"] if last else 0
+
+    observations = 0
+    prev_avg = {}
+    for round_number in range(1, rounds + 1):
+        prices = [
+            price_lines(page)
+            for page in paged(lambda: supabase.table("prices")
+                              .select("id, team_name, prices_json, round_number")
+                              .eq("round_number", round_number), page_size)
+        ]
+        plans = [
+            plan_lines(page)
+            for page in paged(lambda: supabase.table("production_plans")
+                              .select("id, team_name, plan_json")
+                              .eq("round_number", round_number), page_size)
+        ]
+        prices = pd.concat(prices, ignore_index=True) if prices else price_lines([])
+        plans = pd.concat(plans, ignore_index=True) if plans else plan_lines([])
+        # First price per (team, cake, channel), as in settlement
+        team_prices = prices.drop_duplicates(["team_name", "cake", "channel"])[
+            ["team_name", "cake", "channel", "price_usd"]
+        ]
+
+        for page in paged(lambda: supabase.table("demands")
+                          .select("id, team_name, demands_json")
+                          .eq("round_number", round_number), page_size):
+            lines = demand_lines(page).merge(team_prices, on=["team_name", "cake", "channel"], how="inner")
+            equations.add(
+                lines["cake"], lines["channel"], lines["price_usd"],
+                average_prices(prev_avg, lines["channel"], lines["cake"]), lines["demand"],
+            )
+            observations += len(lines)
+
+        prev_avg = competitor_avg_prices(prices, plans)
+
+    return rounds, observations
+
+
+# =====================================
+# 📐 FIT
+# =====================================
+def _rmse(theta, xtx, xty, yty, n):
+    """Root mean squared error of parameters `theta` from the sums."""
+    sse = yty - 2 * np.einsum("kj,kj->k", theta, xty) + np.einsum("kj,kjl,kl->k", theta, xtx, theta)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt(np.maximum(sse, 0.0) / n), sse
+
+
+def fit(equations, demand_params, min_observations=MIN_OBSERVATIONS):
+    """
+    (candidate, diagnostics): `demand_params` with the fitted parameters
+    swapped in, and one row per (cake, channel) with the observation count,
+    what was fitted, current and fitted parameters, the RMSE of both and
+    the R² of the fit.
+    """
+    params = demand_params.dropna(how="all").reset_index(drop=True)
+    xtx, xty, yty, n = equations.stats(params["cake_name"], params["channel"])
+    current = params[PARAMETERS].to_numpy(dtype=float)
+
+    enough = n >= min_observations
+    full = enough & (np.linalg.matrix_rank(xtx) == 3)
+    partial = enough & ~full & (np.linalg.matrix_rank(xtx[:, :2, :2]) == 2)
+
+    theta = current.copy()
+    if full.any():
+        theta[full] = np.linalg.solve(xtx[full], xty[full][:, :, None])[:, :, 0]
+    if partial.any():
+        # gamma stays; alpha and beta fit what is left of y
+        rest = xty[partial][:, :2] - current[partial][:, 2:3] * xtx[partial][:, :2, 2]
+        theta[partial, :2] = np.linalg.solve(xtx[partial][:, :2, :2], rest[:, :, None])[:, :, 0]
+
+    rejected = (full | partial) & ((theta[:, 1] <= 0) | (theta[:, 2] < 0))
+    status = np.select(
+        [n == 0, ~enough, rejected, full, partial],
+        ["no observations", "too few observations", "rejected (beta <= 0 or gamma < 0)",
+         "fitted", "fitted (gamma kept)"],
+        default="prices never varied",
+    )
+    theta = np.where(((full | partial) & ~rejected)[:, None], theta, current)
+
+    rmse_current, _ = _rmse(current, xtx, xty, yty, n)
+    rmse, sse = _rmse(theta, xtx, xty, yty, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = 1 - sse / (yty - xty[:, 0] ** 2 / n)
+
+    candidate = params.copy()
+    candidate[PARAMETERS] = theta.round(4)
+
+    diagnostics = pd.DataFrame({
+        "cake": params["cake_name"],
+        "channel": params["channel"],
+        "observations": n,
+        "status": status,
+        **{f"{name}_current": current[:, k] for k, name in enumerate(PARAMETERS)},
+        **{name: theta[:, k] for k, name in enumerate(PARAMETERS)},
+        "rmse_current": rmse_current,
+        "rmse": rmse,
+        "r2": r2,
+    })
+    return candidate, diagnostics
+
+
+def calibrate(clients, demand_params=None, page_size=PAGE_SIZE, min_observations=MIN_OBSERVATIONS):
+    """
+    Fit the demand parameters to the history of every Supabase client in
+    `clients`. Returns (candidate, diagnostics, report).
+    """
+    if demand_params is None:
+        demand_params = pd.read_csv(os.path.join(DATA_DIR, CANDIDATE_FILE), encoding="utf-8-sig")
+
+    start = time.perf_counter()
+    equations = NormalEquations()
+    rounds = observations = 0
+    for supabase in clients:
+        game_rounds, game_observations = accumulate(supabase, equations, page_size)
+        rounds += game_rounds
+        observations += game_observations
+
+    candidate, diagnostics = fit(equations, demand_params, min_observations)
+    report = {
+        "games": len(clients),
+        "rounds": rounds,
+        "observations": observations,
+        "seconds": time.perf_counter() - start,
+    }
+    return candidate, diagnostics, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit demand parameters to historical submissions.")
+    parser.add_argument("games", nargs="*",
+                        help="game ids to read (default: comma-separated CAKEGAME_GAMES, else the default game)")
+    parser.add_argument("--out", default="calibration", help="directory for the candidate CSV and diagnostics")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="rows per request")
+    parser.add_argument("--min-observations", type=int, default=MIN_OBSERVATIONS,
+                        help="points a (cake, channel) needs before it is refitted")
+    args = parser.parse_args(argv)
+
+    games = args.games or [g.strip() for g in os.getenv("CAKEGAME_GAMES", "").split(",") if g.strip()] or [None]
+    candidate, diagnostics, report = calibrate(
+        [get_client(game_id) for game_id in games],
+        page_size=args.page_size,
+        min_observations=args.min_observations,
+    )
+
+    os.makedirs(args.out, exist_ok=True)
+    candidate.to_csv(os.path.join(args.out, CANDIDATE_FILE), index=False, float_format="%g")
+    diagnostics.to_csv(os.path.join(args.out, DIAGNOSTICS_FILE), index=False)
+
+    print(diagnostics.round(3).to_string(index=False))
+    print(f"\n{report['observations']} observations from {report['rounds']} rounds in {report['games']} game(s) "
+          f"in {report['seconds']:.2f}s; wrote {CANDIDATE_FILE} and {DIAGNOSTICS_FILE} to {args.out}/")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
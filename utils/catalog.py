@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Reference Catalog — Cake Simulation
+
+The `cakes`, `channels` and `recipes` tables and the parameter CSVs in
+data/ do not change during a game, so they are loaded once per process
+(per game) into a read-only Catalog and shared by every page rerun,
+session and finalization job. Entries expire after CATALOG_TTL_SECONDS;
+the Admin panel calls invalidate_catalog() after editing reference data.
+"""
+
+import os
+import threading
+import time
+from types import MappingProxyType
+
+import pandas as pd
+
+from utils.db import get_client
+from utils.demand import DemandModel
+from utils.recipes import recipe_matrix
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+CATALOG_TTL_SECONDS = 15 * 60
+
+WAGE_PARAMETERS = {
+    "prep": "prep_wage_usd_per_hour",
+    "oven": "oven_wage_usd_per_hour",
+    "package": "package_wage_usd_per_hour",
+    "oven rental": "oven_rental_wage_usd_per_hour",
+}
+
+_catalogs = {}
+_load_locks = {}
+_catalogs_lock = threading.Lock()
+
+
+def _read_csv(name):
+    return pd.read_csv(os.path.join(DATA_DIR, name), encoding="utf-8-sig")
+
+
+class Catalog:
+    """
+    Read-only reference data for one game. DataFrame attributes return a
+    fresh copy on each access (callers may modify it); lookups are
+    read-only mappings, the recipe matrix is not writeable and
+    `demand_model` evaluates the shared demand rule (utils.demand).
+    """
+
+    def __init__(self, cakes, channels, recipes, ingredients, wages, price_caps, demand_params):
+        self._frames = {
+            "cakes": cakes,
+            "channels": channels,
+            "ingredients": ingredients,
+            "wages": wages,
+            "price_caps": price_caps,
+            "demand_params": demand_params,
+        }
+        self.recipes = recipes
+        self.demand_model = DemandModel(demand_params)
+        self.loaded_at = time.monotonic()
+
+        self.cake_names = tuple(cakes["name"]) if "name" in cakes else ()
+        self.channel_names = tuple(channels["channel"]) if "channel" in channels else ()
+        self.packaging_cost = _lookup(cakes, "name", "packaging_cost_per_unit_usd")
+        self.transport_cost = _lookup(channels, "channel", "transport_cost_per_unit_usd")
+        self.ingredient_cost = MappingProxyType({
+            str(ing).lower(): float(cost)
+            for ing, cost in zip(ingredients["ingredient"], ingredients["unit_cost_usd"])
+        })
+        wage_values = dict(zip(wages["parameter"], wages["value"]))
+        self.wage_rates = MappingProxyType({
+            key: float(wage_values[param])
+            for key, param in WAGE_PARAMETERS.items()
+            if param in wage_values
+        })
+        self.max_price = MappingProxyType({
+            (ch, cake): float(cap)
+            for cake, ch, cap in zip(price_caps["cake"], price_caps["channel"], price_caps["max_price"])
+        })
+
+    def _frame(self, name):
+        return self._frames[name].copy()
+
+    cakes = property(lambda self: self._frame("cakes"))
+    channels = property(lambda self: self._frame("channels"))
+    ingredients = property(lambda self: self._frame("ingredients"))
+    wages = property(lambda self: self._frame("wages"))
+    price_caps = property(lambda self: self._frame("price_caps"))
+    demand_params = property(lambda self: self._frame("demand_params"))
+
+
+def _lookup(df, key, value):
+    if key not in df or value not in df:
+        return MappingProxyType({})
+    return MappingProxyType(dict(zip(df[key], df[value])))
+
+
+def load_catalog(supabase, timer=None):
+    """
+    Fetch every reference table and CSV (3 round-trips, counted against
+    the running phase of `timer` when given, see utils.phase_timer).
+    """
+    execute = timer.execute if timer is not None else (lambda query: query.execute())
+    return Catalog(
+        cakes=pd.DataFrame(execute(supabase.table("cakes").select("*")).data or []),
+        channels=pd.DataFrame(execute(supabase.table("channels").select("*")).data or []),
+        recipes=recipe_matrix(execute(supabase.table("recipes").select("*")).data or []),
+        ingredients=_read_csv("ingredients.csv"),
+        wages=_read_csv("wages_energy.csv"),
+        price_caps=_read_csv("price_caps.csv"),
+        demand_params=_read_csv("instructor_demand_competition.csv"),
+    )
+
+
+def _fresh(catalog):
+    return catalog is not None and time.monotonic() - catalog.loaded_at <= CATALOG_TTL_SECONDS
+
+
+def get_catalog(game_id=None, supabase=None, timer=None):
+    """
+    The cached Catalog of one game, loaded through `supabase` (default: the
+    game's shared client) when missing or older than CATALOG_TTL_SECONDS.
+    A load's queries are counted by `timer`, if given.
+    """
+    with _catalogs_lock:
+        catalog = _catalogs.get(game_id)
+        if _fresh(catalog):
+            return catalog
+        load_lock = _load_locks.setdefault(game_id, threading.Lock())
+
+    # Loads hold only their game's lock: cached reads and other games never
+    # wait on the network, and a second caller reuses the first one's load
+    with load_lock:
+        with _catalogs_lock:
+            catalog = _catalogs.get(game_id)
+        if not _fresh(catalog):
+            catalog = load_catalog(supabase or get_client(game_id), timer)
+            with _catalogs_lock:
+                _catalogs[game_id] = catalog
+        return catalog
+
+
+def invalidate_catalog(*game_ids):
+    """Drop the cached catalogs of `game_ids`, or of every game when none are given."""
+    with _catalogs_lock:
+        if not game_ids:
+            _catalogs.clear()
+        for game_id in game_ids:
+            _catalogs.pop(game_id, None)
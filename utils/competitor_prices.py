@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Competitor Prices — Cake Simulation
+
+The average price per (channel, cake) over the teams that produced that
+cake in a round (utils.settlement.competitor_avg_prices) never changes
+once the round is finalized. finalize_round stores it in the
+`competitor_prices` table (sql/competitor_prices.sql), so the Demand page
+reads a few dozen numbers instead of every team's plans and prices.
+
+Rounds finalized before the table existed have no stored rows; their
+averages are computed from the round's plans and prices as before, and
+kept per client for LIVE_TTL_SECONDS so reruns do not repeat that read.
+"""
+
+import threading
+import time
+
+from utils.db import read_concurrently
+from utils.settlement import competitor_avg_prices, plan_lines, price_lines
+
+
+LIVE_TTL_SECONDS = 60.0
+
+_live_averages = {}
+_live_lock = threading.Lock()
+
+
+def stored_rows(round_number, avg_price):
+    """`competitor_prices` rows for {(channel, cake): average} of one round."""
+    return [
+        {"round_number": round_number, "channel": channel, "cake": cake, "avg_price": float(avg)}
+        for (channel, cake), avg in avg_price.items()
+    ]
+
+
+def competitor_prices_query(supabase, round_number):
+    """Unexecuted select of the averages stored for `round_number`."""
+    return (
+        supabase.table("competitor_prices")
+        .select("channel, cake, avg_price")
+        .eq("round_number", round_number)
+    )
+
+
+def live_competitor_prices(supabase, round_number):
+    """Averages computed from the round's plans and prices (2 round-trips, run together)."""
+    reads = read_concurrently(
+        plans=supabase.table("production_plans").select("team_name, plan_json").eq("round_number", round_number),
+        prices=(
+            supabase.table("prices")
+            .select("team_name, prices_json, round_number")
+            .eq("round_number", round_number)
+            .order("id")
+        ),
+    )
+    return competitor_avg_prices(price_lines(reads.data("prices") or []), plan_lines(reads.data("plans") or []))
+
+
+def _cached_live_competitor_prices(supabase, round_number):
+    key = (supabase, round_number)
+    with _live_lock:
+        cached = _live_averages.get(key)
+    if cached is None or time.monotonic() - cached[0] >= LIVE_TTL_SECONDS:
+        cached = (time.monotonic(), live_competitor_prices(supabase, round_number))
+        with _live_lock:
+            _live_averages[key] = cached
+    return dict(cached[1])
+
+
+def competitor_prices(supabase, round_number, stored=None):
+    """
+    {(channel, cake): average price} of `round_number` ({} before round 1).
+    `stored` is the already-fetched result of competitor_prices_query, if
+    any; without stored rows the averages are computed live (cached for
+    LIVE_TTL_SECONDS).
+    """
+    if round_number < 1:
+        return {}
+    if stored is None:
+        try:
+            stored = competitor_prices_query(supabase, round_number).execute().data
+        except Exception:
+            stored = None  # table not created yet
+    if stored:
+        return {(r["channel"], r["cake"]): float(r["avg_price"]) for r in stored}
+    return _cached_live_competitor_prices(supabase, round_number)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Data Access — Cake Simulation
+
+One Supabase client per game for the whole process. Streamlit re-executes
+page scripts on every interaction, but imported modules survive reruns, so
+the client (and its pooled HTTP connections) is built once here and shared
+by every page, session, background finalization job and script.
+
+Pages use the query helpers below instead of building their own clients.
+Every helper takes an optional `supabase` client; by default it uses the
+shared client of the default game.
+
+`game_state` is read as one snapshot of every key, shared by all sessions
+for GAME_STATE_TTL_SECONDS and dropped as soon as this process writes it.
+
+Independent reads can be started together with read_concurrently(), so a
+page waits for its slowest query instead of the sum of all of them.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+
+from dotenv import load_dotenv
+from supabase import ClientOptions, create_client
+
+from utils.http_client import resilient_http_client
+from utils.query_trace import TracingClient, current_trace
+
+
+ENV_PATH = Path(__file__).parent.parent / ".env"
+load_dotenv(dotenv_path=ENV_PATH)
+
+GAME_STATE_TTL_SECONDS = 3.0
+READ_POOL_SIZE = 32
+
+_state_snapshots = {}
+_state_writes = 0
+_state_lock = threading.Lock()
+_read_pool = ThreadPoolExecutor(max_workers=READ_POOL_SIZE, thread_name_prefix="db-read")
+
+
+def game_env_suffix(game_id):
+    """Suffix of a game's credential variables: "Section A" → "SECTION_A"."""
+    return "".join(c if c.isalnum() else "_" for c in str(game_id)).upper()
+
+
+def get_client(game_id=None):
+    """
+    Shared client for one game. Each course section (game/cohort) runs in
+    its own Supabase project; `game_id` selects SUPABASE_URL_<GAME> and
+    SUPABASE_KEY_<GAME> instead of the default SUPABASE_URL / SUPABASE_KEY.
+    Raises RuntimeError when the credentials are missing.
+
+    With CAKEGAME_BACKEND=offline every game gets its own seeded in-memory
+    OfflineClient instead (see utils.offline_backend). Either way requests
+    are traced (see utils.query_trace). Supabase clients share a bounded,
+    retrying connection pool per game (see utils.http_client).
+    """
+    # lru_cache keys get_client() and get_client(None) apart; pass the id
+    # positionally so both return the same client
+    return _cached_client(game_id)
+
+
+@lru_cache(maxsize=None)
+def _cached_client(game_id):
+    if os.getenv("CAKEGAME_BACKEND", "supabase").lower() == "offline":
+        from utils.offline_backend import offline_client
+        return TracingClient(offline_client())
+
+    suffix = f"_{game_env_suffix(game_id)}" if game_id is not None else ""
+    url = os.getenv(f"SUPABASE_URL{suffix}")
+    key = os.getenv(f"SUPABASE_KEY{suffix}")
+    if not url or not key:
+        raise RuntimeError(f"Missing Supabase credentials (SUPABASE_URL{suffix} / SUPABASE_KEY{suffix}).")
+    options = ClientOptions(httpx_client=resilient_http_client())
+    return TracingClient(create_client(url, key, options=options))
+
+
+# =====================================
+# 🎮 GAME STATE
+# =====================================
+def get_game_state(supabase=None):
+    """
+    Read-only {key: value} of every `game_state` row, fetched in one query
+    at most once per GAME_STATE_TTL_SECONDS per client.
+    """
+    supabase = supabase or get_client()
+    with _state_lock:
+        cached = _state_snapshots.get(supabase)
+        if cached is not None and time.monotonic() - cached[0] < GAME_STATE_TTL_SECONDS:
+            return cached[1]
+        writes = _state_writes
+
+    rows = supabase.table("game_state").select("key, value").execute().data or []
+    snapshot = MappingProxyType({r["key"]: r["value"] for r in rows})
+    with _state_lock:
+        # A write that landed while we were reading may not be in `rows`
+        if writes == _state_writes:
+            _state_snapshots[supabase] = (time.monotonic(), snapshot)
+    return snapshot
+
+
+def invalidate_game_state(supabase=None):
+    global _state_writes
+    with _state_lock:
+        _state_writes += 1
+        _state_snapshots.pop(supabase or get_client(), None)
+
+
+def get_state(key: str, supabase=None):
+    """Raw `game_state` value for `key`, or None if the row is missing."""
+    return get_game_state(supabase).get(key)
+
+
+def set_state(key: str, value, supabase=None):
+    supabase = supabase or get_client()
+    try:
+        supabase.table("game_state").update({"value": str(value)}).eq("key", key).execute()
+    finally:
+        invalidate_game_state(supabase)
+
+
+def get_current_round(supabase=None) -> int:
+    value = get_state("current_round", supabase)
+    if value is None:
+        raise RuntimeError("game_state has no current_round")
+    return int(value)
+
+
+def set_current_round(new_round: int, supabase=None):
+    set_state("current_round", new_round, supabase)
+
+
+def submissions_locked(supabase=None) -> bool:
+    return get_state("locked", supabase) == "true"
+
+
+def set_submissions_locked(locked: bool, supabase=None):
+    set_state("locked", "true" if locked else "false", supabase)
+
+
+# =====================================
+# 👥 TEAMS
+# =====================================
+def get_team(team_name: str, columns: str = "*", supabase=None):
+    """One `teams` row (selected `columns`) or None."""
+    supabase = supabase or get_client()
+    resp = supabase.table("teams").select(columns).eq("team_name", team_name).limit(1).execute()
+    return resp.data[0] if resp.data else None
+
+
+def list_teams(columns: str = "*", supabase=None):
+    supabase = supabase or get_client()
+    return supabase.table("teams").select(columns).execute().data or []
+
+
+# =====================================
+# 🧵 CONCURRENT READS
+# =====================================
+class ConcurrentReads:
+    """Queries started together on the shared read pool, awaited where they are used."""
+
+    def __init__(self, queries):
+        # Each query runs in a copy of the caller's context so it is traced
+        # against the page rerun that issued it
+        self._futures = {
+            name: _read_pool.submit(contextvars.copy_context().run, query.execute)
+            for name, query in queries.items()
+            if query is not None
+        }
+
+    def response(self, name):
+        """Wait for `name` and return its response; re-raises the query's error."""
+        try:
+            return self._futures[name].result()
+        finally:
+            trace = current_trace()
+            if trace is not None:
+                trace.refresh()
+
+    def data(self, name, default=None):
+        """`.data` of `name`, or `default` if that query was not started (None)."""
+        if name not in self._futures:
+            return default
+        return self.response(name).data
+
+
+def read_concurrently(**queries):
+    """
+    Start independent queries (unexecuted builders; None entries are
+    skipped) at once and return a ConcurrentReads to collect them from.
+    """
+    return ConcurrentReads(queries)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Demand Model — Cake Simulation
+
+The one linear demand rule, shared by the Demand page (forecast and final
+submission) and round settlement:
+
+    D = max(0, floor(alpha - beta * p + gamma * (avg - p)))
+
+`avg` is the competitors' mean price for the (channel, cake) (see
+utils.settlement.competitor_avg_prices). Without one (round 1, or nobody
+sells that cake) the competition term is dropped, i.e. avg = p. Price
+points whose (cake, channel) has no parameters have no demand.
+
+DemandModel indexes the parameter table once (the Catalog keeps one per
+game) and evaluates any number of price points as arrays. simulate() adds
+normal noise with the (cake, channel)'s `sigma_noise` to the same rule
+and summarizes MC_SAMPLES seeded draws per price point: demand
+percentiles and, for a production quantity, the expected units sold.
+Settlement itself stays deterministic.
+
+DemandCurves tabulates demand and unit profit of every (cake, channel)
+over a price grid up to its cap, for one set of competitor averages, so
+what-if pricing is answered by interpolation; demand_curves() caches them.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+FORECAST_COLUMNS = ["cake", "channel", "price_usd", "avg_price", "demand"]
+
+MC_SAMPLES = 4000
+MC_SEED = 0
+PERCENTILES = (10, 50, 90)
+
+PRICE_GRID_STEP = 0.05
+CURVE_CACHE_SIZE = 32
+
+_curves = OrderedDict()
+_curves_lock = threading.Lock()
+
+
+class DemandModel:
+    """Demand parameters indexed by (cake, channel)."""
+
+    def __init__(self, demand_params):
+        params = demand_params.drop_duplicates(["cake_name", "channel"])
+        self.rows = {key: i for i, key in enumerate(zip(params["cake_name"], params["channel"]))}
+        self.alpha = params["alpha"].to_numpy(dtype=float)
+        self.beta = params["beta"].to_numpy(dtype=float)
+        self.gamma = params["gamma_competition"].to_numpy(dtype=float)
+        if "sigma_noise" in params:
+            self.sigma = params["sigma_noise"].fillna(0).to_numpy(dtype=float)
+        else:
+            self.sigma = np.zeros(len(params))
+
+    def lookup(self, cakes, channels):
+        """Parameter row of each (cake, channel); -1 where there is none."""
+        rows = self.rows
+        return np.fromiter((rows.get(key, -1) for key in zip(cakes, channels)), dtype=int)
+
+    def _linear(self, cakes, channels, prices, avg_prices):
+        """(parameter rows, rows clipped to valid indices, demand before floor/clamp)."""
+        rows = self.lookup(cakes, channels)
+        price = np.asarray(prices, dtype=float)
+        avg = price if avg_prices is None else np.asarray(avg_prices, dtype=float)
+        avg = np.where(np.isnan(avg), price, avg)
+        if not len(self.alpha):
+            return rows, rows, np.full(price.shape, np.nan)
+
+        i = np.maximum(rows, 0)
+        return rows, i, self.alpha[i] - self.beta[i] * price + self.gamma[i] * (avg - price)
+
+    def demand(self, cakes, channels, prices, avg_prices=None):
+        """
+        Units demanded at each price point; NaN where the (cake, channel)
+        has no parameters. NaN (or omitted) averages mean no competition.
+        """
+        rows, _, linear = self._linear(cakes, channels, prices, avg_prices)
+        return np.where(rows >= 0, np.maximum(0, np.floor(linear)), np.nan)
+
+    def simulate(self, cakes, channels, prices, avg_prices=None, quantities=None,
+                 samples=MC_SAMPLES, seed=MC_SEED):
+        """
+        Monte-Carlo demand per price point: one row with `demand_p10`,
+        `demand_p50`, `demand_p90` (see PERCENTILES) and `demand_mean`, plus
+        `expected_sold` (mean of min(qty, demand)) and `sell_out` (share of
+        draws where demand reaches qty) when `quantities` are given. Rows
+        without parameters are NaN. The same `seed` gives the same draws.
+        """
+        rows, i, linear = self._linear(cakes, channels, prices, avg_prices)
+        sigma = self.sigma[i] if len(self.sigma) else np.zeros(linear.shape)
+        noise = np.random.default_rng(seed).standard_normal((samples, linear.size))
+        draws = np.maximum(0, np.floor(linear + noise * sigma))
+        known = rows >= 0
+
+        result = {
+            f"demand_p{q}": np.where(known, values, np.nan)
+            for q, values in zip(PERCENTILES, np.percentile(draws, PERCENTILES, axis=0))
+        }
+        result["demand_mean"] = np.where(known, draws.mean(axis=0), np.nan)
+        if quantities is not None:
+            qty = np.asarray(quantities, dtype=float)
+            result["expected_sold"] = np.where(known, np.minimum(draws, qty).mean(axis=0), np.nan)
+            result["sell_out"] = np.where(known, (draws >= qty).mean(axis=0), np.nan)
+        return pd.DataFrame(result)
+
+    def optimal_prices(self, cakes, channels, unit_costs, max_prices, avg_prices=None, own_weight=0.0,
+                       whole_units=True):
+        """
+        Profit-maximizing price in dollars, rounded to the cent, per (cake,
+        channel), capped to [0, max price]; NaN where the pair has no
+        parameters.
+
+        `own_weight` (w) is the weight of the seller's own price in the average
+        (1/n when settlement averages n sellers); `avg_prices` is then the
+        other sellers' mean, and the average is w*p + (1 - w)*avg_prices.
+
+        Before rounding to whole units, demand is A - B*p with
+        A = alpha + g*avg and B = beta + g, g = gamma*(1 - w) (A = alpha,
+        B = beta without competitors), so profit (p - c)(A - B*p) peaks at
+        p* = (A + B*c) / (2B), and as profit is concave the capped optimum
+        is p* clipped to the range. Demand then comes in whole units: of the
+        unit counts just below and above the one at p*, the highest price
+        still selling each is compared and the more profitable one kept
+        (unless `whole_units` is False, which returns the clipped p*).
+        """
+        rows = self.lookup(cakes, channels)
+        cost = np.asarray(unit_costs, dtype=float)
+        cap = np.asarray(max_prices, dtype=float)
+        avg = np.full(cost.shape, np.nan) if avg_prices is None else np.asarray(avg_prices, dtype=float)
+        if not len(self.alpha):
+            return np.full(cost.shape, np.nan)
+
+        i = np.maximum(rows, 0)
+        competing = ~np.isnan(avg)
+        gamma = self.gamma[i] * (1.0 - own_weight)
+        a = self.alpha[i] + np.where(competing, gamma * np.nan_to_num(avg), 0.0)
+        b = self.beta[i] + np.where(competing, gamma, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            best = np.clip(np.where(b > 0, (a + b * cost) / (2 * b), cap), 0.0, cap)
+            if not whole_units:
+                return np.where(rows >= 0, best, np.nan)
+            units = np.floor(a - b * best)
+            candidates = [
+                np.clip(np.where(b > 0, np.floor((a - n) / b * 100 - 1e-6) / 100, cap), 0.0, cap)
+                for n in (units, units + 1)
+            ]
+        profits = [
+            np.nan_to_num(self.demand(cakes, channels, price, own_weight * price + (1.0 - own_weight) * avg))
+            * (price - cost)
+            for price in candidates
+        ]
+        best = np.where(profits[1] > profits[0], candidates[1], candidates[0])
+        return np.where(rows >= 0, best, np.nan)
+
+    def forecast(self, entries, avg_price):
+        """
+        Demand for price entries ({"cake", "channel", "price_usd"} dicts)
+        given {(channel, cake): competitor average}. One row per entry that
+        has parameters, with `avg_price` NaN where there is no competition.
+        """
+        if not entries:
+            return pd.DataFrame(columns=FORECAST_COLUMNS)
+
+        frame = pd.DataFrame(entries)[["cake", "channel", "price_usd"]]
+        frame["avg_price"] = average_prices(avg_price, frame["channel"], frame["cake"])
+        frame["demand"] = self.demand(frame["cake"], frame["channel"], frame["price_usd"], frame["avg_price"])
+        return frame[frame["demand"].notna()].reset_index(drop=True)
+
+
+def average_prices(avg_price, channels, cakes):
+    """{(channel, cake): average} looked up per price point; NaN when missing."""
+    return np.array([avg_price.get(k, np.nan) for k in zip(channels, cakes)], dtype=float)
+
+
+class DemandCurves:
+    """
+    Demand and profit curves per (channel, cake) on a price grid from 0 to
+    the cap in `max_price`, for the competitor averages `avg_price`. Unit
+    profit is the price minus `unit_cost[(channel, cake)]` (transport and
+    packaging, as in settlement); pairs without parameters are left out.
+    """
+
+    def __init__(self, model, max_price, avg_price, unit_cost, step=PRICE_GRID_STEP):
+        self.prices, self.linear, self.demand, self.profit = {}, {}, {}, {}
+        self.unit_cost = dict(unit_cost)
+        for (channel, cake), cap in max_price.items():
+            if (cake, channel) not in model.rows or not cap > 0:
+                continue
+            grid = np.linspace(0.0, cap, int(np.ceil(cap / step)) + 1)
+            n = len(grid)
+            _, _, linear = model._linear([cake] * n, [channel] * n, grid,
+                                         np.full(n, avg_price.get((channel, cake), np.nan)))
+            demand = np.maximum(0, np.floor(linear))
+            key = (channel, cake)
+            self.prices[key] = grid
+            self.linear[key] = linear
+            self.demand[key] = demand
+            self.profit[key] = demand * (grid - self.unit_cost.get(key, 0.0))
+
+    def lookup(self, cakes, channels, prices):
+        """
+        (demand, profit) arrays at each price point; prices outside a
+        curve are clamped to it, unknown pairs are NaN.
+        """
+        price = np.asarray(prices, dtype=float)
+        demand = np.full(price.shape, np.nan)
+        profit = np.full(price.shape, np.nan)
+        for n, key in enumerate(zip(channels, cakes)):
+            grid = self.prices.get(key)
+            if grid is None:
+                continue
+            p = min(max(price[n], 0.0), grid[-1])
+            # Demand is linear in price, so interpolation is exact; rounding
+            # keeps float error from flooring a whole unit away
+            demand[n] = max(0, np.floor(np.round(np.interp(p, grid, self.linear[key]), 6)))
+            profit[n] = demand[n] * (p - self.unit_cost.get(key, 0.0))
+        return demand, profit
+
+    def what_if(self, entries):
+        """Demand and profit for price entries ({"cake", "channel", "price_usd"} dicts)."""
+        if not entries:
+            return pd.DataFrame(columns=["cake", "channel", "price_usd", "demand", "profit"])
+
+        frame = pd.DataFrame(entries)[["cake", "channel", "price_usd"]]
+        frame["demand"], frame["profit"] = self.lookup(frame["cake"], frame["channel"], frame["price_usd"])
+        return frame[frame["demand"].notna()].reset_index(drop=True)
+
+    def curve(self, channel, cake):
+        """One pair's curve as a DataFrame (price, demand, profit), or None."""
+        key = (channel, cake)
+        if key not in self.prices:
+            return None
+        return pd.DataFrame({"price": self.prices[key], "demand": self.demand[key], "profit": self.profit[key]})
+
+
+def demand_curves(catalog, avg_price):
+    """
+    DemandCurves of a Catalog for competitor averages `avg_price`, cached
+    (CURVE_CACHE_SIZE entries) so reruns with the same averages reuse them.
+    """
+    # The entry holds the catalog, so its id cannot be reused while cached
+    key = (id(catalog), tuple(sorted(avg_price.items())))
+    with _curves_lock:
+        if key in _curves:
+            _curves.move_to_end(key)
+            return _curves[key][1]
+
+    unit_cost = {
+        (channel, cake): float(catalog.transport_cost.get(channel, 0) or 0)
+        + float(catalog.packaging_cost.get(cake, 0) or 0)
+        for channel, cake in catalog.max_price
+    }
+    curves = DemandCurves(catalog.demand_model, catalog.max_price, avg_price, unit_cost)
+    with _curves_lock:
+        _curves[key] = (catalog, curves)
+        while len(_curves) > CURVE_CACHE_SIZE:
+            _curves.popitem(last=False)
+    return curves
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Editor Tables — Cake Simulation
+
+The pricing and production editors show one row per cake and one column
+per channel; pages store one entry per (cake, channel). Both directions
+are whole-frame reshapes (unstack / a row-major ravel) joined against
+lookups built once (price caps, transport costs, minimum batches), so an
+editor round trip costs the same few array operations however large the
+catalog is.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+PRICE_CAKE_COLUMN = "Cake"
+PLAN_CAKE_COLUMN = "Cake (min qty)"
+
+
+def _wide(values, cakes, channels):
+    """{(channel, cake): value} as a cakes × channels frame, 0 where missing."""
+    series = pd.Series(values, dtype=float)
+    if series.empty:
+        return pd.DataFrame(0.0, index=list(cakes), columns=list(channels))
+    return series.unstack(0).reindex(index=list(cakes), columns=list(channels)).fillna(0.0)
+
+
+def _long(edited, cake_column, channels):
+    """
+    Edited wide frame → (cakes, channels, values) arrays, one element per
+    cell, cake by cake in table order; non-numeric cells count as 0.
+    """
+    channels = list(channels)
+    values = edited[channels].apply(pd.to_numeric, errors="coerce").fillna(0).to_numpy()
+    # Row-major ravel walks each cake's channels in turn, as the table reads
+    return (
+        np.repeat(edited[cake_column].to_numpy(dtype=object), len(channels)),
+        np.tile(np.array(channels, dtype=object), len(edited)),
+        values.ravel(),
+    )
+
+
+# =====================================
+# 💲 PRICING EDITOR
+# =====================================
+def price_table(cakes, channels, prices, avg_prices):
+    """
+    Pricing editor frame: "Cake", then per channel the previous-round
+    competitor average ("<channel> (prev)") and the price ("<channel>"),
+    from {(channel, cake): value} mappings (0 where missing).
+    """
+    prev = _wide(avg_prices, cakes, channels).round(2)
+    price = _wide(prices, cakes, channels)
+
+    columns = {PRICE_CAKE_COLUMN: list(cakes)}
+    for channel in channels:
+        columns[f"{channel} (prev)"] = prev[channel].to_numpy()
+        columns[channel] = price[channel].to_numpy()
+    return pd.DataFrame(columns)
+
+
+def read_price_table(edited, team_name, channels, max_price, transport_cost):
+    """
+    Price entries to store from the edited pricing table: prices clamped to
+    [0, cap] (`max_price` keyed by (channel, cake); no cap when missing),
+    zero prices dropped, with the channel's transport cost.
+    """
+    cakes, channels, prices = _long(edited, PRICE_CAKE_COLUMN, channels)
+    cap = np.array([max_price.get(key, np.inf) for key in zip(channels, cakes)], dtype=float)
+    prices = np.clip(prices.astype(float), 0, cap)
+    transport = {channel: float(cost) for channel, cost in dict(transport_cost).items()}
+
+    keep = prices > 0
+    return [
+        {
+            "team_name": team_name,
+            "channel": channel,
+            "cake": cake,
+            "price_usd": float(price),
+            "transport_cost_usd": transport.get(channel, 0.0),
+        }
+        for cake, channel, price in zip(cakes[keep], channels[keep], prices[keep])
+    ]
+
+
+# =====================================
+# 🧁 PRODUCTION EDITOR
+# =====================================
+def plan_label(cake, min_units):
+    return f"{cake} (min {int(min_units)})"
+
+
+def plan_table(min_units, channels, quantities=None):
+    """
+    Production editor frame: "Cake (min qty)" labels from {cake: minimum
+    units if made} and one quantity column per channel, from
+    {(channel, cake): qty} (0 where missing).
+    """
+    cakes = list(min_units)
+    qty = _wide(quantities or {}, cakes, channels).astype(int)
+    frame = qty.reset_index(drop=True)
+    frame.insert(0, PLAN_CAKE_COLUMN, [plan_label(cake, min_units[cake]) for cake in cakes])
+    return frame
+
+
+def read_plan_table(edited, channels, min_units):
+    """
+    (entries, violations) from the edited production table: one
+    {"cake", "channel", "qty"} per positive quantity, and the (cake,
+    minimum) of every cake made in a total below its minimum.
+    """
+    cake_of = {plan_label(cake, n): cake for cake, n in min_units.items()}
+    edited = edited.reset_index(drop=True)
+    cakes = edited[PLAN_CAKE_COLUMN].map(cake_of)
+
+    totals = edited[list(channels)].apply(pd.to_numeric, errors="coerce").fillna(0).sum(axis=1)
+    minimums = cakes.map(min_units)
+    short = (totals > 0) & (totals < minimums)
+    violations = [(cake, int(n)) for cake, n in zip(cakes[short], minimums[short])]
+
+    cakes, channels, qty = _long(edited.assign(**{PLAN_CAKE_COLUMN: cakes}), PLAN_CAKE_COLUMN, channels)
+    keep = qty > 0
+    entries = [
+        {"cake": cake, "channel": channel, "qty": n.item()}
+        for cake, channel, n in zip(cakes[keep], channels[keep], qty[keep])
+    ]
+    return entries, violations
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Market Equilibrium — Cake Simulation
+
+Instructor check of the demand parameters before a semester: the price
+table a cohort reaches when every team keeps answering the others' prices
+with its most profitable one.
+
+Every team sells every capped (cake, channel) that has demand parameters,
+at its own unit costs (utils.pricing.unit_costs, optionally spread per
+team). Settlement averages the prices of all n teams selling a pair, the
+team's own included, so each team best-responds to the mean of the other
+n - 1 with own weight 1/n (DemandModel.optimal_prices). All teams × pairs
+are updated at once and damped,
+
+    p <- p + DAMPING * (best response - p),
+
+from the prices each team would charge without competitors, until no best
+response is more than TOLERANCE away (or MAX_ITERATIONS is reached).
+
+Whole units make best responses jump between unit counts, and iterating
+on them cycles instead of settling, so the iteration runs on the smooth
+optimum and each team then rounds once to its whole-unit best response
+(rounded to the cent). `regret` is what a team could still gain on a pair by
+re-pricing alone against those final prices.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.pricing import unit_costs
+
+
+DAMPING = 0.5
+TOLERANCE = 0.01
+MAX_ITERATIONS = 200
+COST_SEED = 0
+
+
+def team_costs(catalog, teams, spread=0.0, seed=COST_SEED):
+    """
+    Unit cost of every (team, cake, channel): the catalog's unit costs,
+    scaled per team by a seeded uniform factor in [1 - spread, 1 + spread].
+    """
+    costs = unit_costs(catalog)[["cake", "channel", "unit_cost"]]
+    teams = list(teams)
+    scale = np.random.default_rng(seed).uniform(1.0 - spread, 1.0 + spread, len(teams))
+
+    frame = costs.loc[np.tile(costs.index, len(teams))].reset_index(drop=True)
+    frame.insert(0, "team_name", np.repeat(teams, len(costs)))
+    frame["unit_cost"] *= np.repeat(scale, len(costs))
+    return frame
+
+
+class Equilibrium:
+    """
+    Solved prices of a cohort: `cost`, `prices`, `demand`, `profit` and
+    `regret` are teams × pairs arrays over `teams` and `pairs` (cake,
+    channel, max_price; one row per column), `avg_price` the market
+    average per pair.
+    """
+
+    def __init__(self, teams, pairs, cost, prices, demand, regret, iterations, converged, gap, seconds):
+        self.teams = teams
+        self.pairs = pairs
+        self.cost = cost
+        self.prices = prices
+        self.avg_price = prices.mean(axis=0)
+        self.demand = demand
+        self.profit = demand * (prices - cost)
+        self.regret = regret
+        self.iterations = iterations
+        self.converged = converged
+        self.gap = gap
+        self.seconds = seconds
+
+    def market(self):
+        """
+        One row per (cake, channel): average, lowest and highest team price,
+        mean demand, margin, profit and regret per team, and whether the
+        pair ends up at its price cap or without sales.
+        """
+        frame = self.pairs.copy()
+        frame["avg_price"] = self.avg_price
+        frame["min_price"] = self.prices.min(axis=0)
+        frame["top_price"] = self.prices.max(axis=0)
+        frame["demand"] = self.demand.mean(axis=0)
+        frame["margin"] = (self.prices - self.cost).mean(axis=0)
+        frame["profit"] = self.profit.mean(axis=0)
+        frame["regret"] = self.regret.mean(axis=0)
+        frame["at_cap"] = np.all(self.prices >= frame["max_price"].to_numpy() - 0.005, axis=0)
+        frame["no_sales"] = self.demand.sum(axis=0) == 0
+        return frame
+
+
+def solve_equilibrium(catalog, costs, damping=DAMPING, tol=TOLERANCE, max_iter=MAX_ITERATIONS):
+    """
+    Damped best-response equilibrium for `costs` (team_name, cake,
+    channel, unit_cost rows, see team_costs; at least one team). Pairs
+    without a price cap or demand parameters are left out.
+    """
+    start = time.perf_counter()
+    model = catalog.demand_model
+
+    cost = costs.pivot_table(index="team_name", columns=["cake", "channel"], values="unit_cost", sort=False)
+    pairs = pd.DataFrame(list(cost.columns), columns=["cake", "channel"])
+    pairs["max_price"] = [catalog.max_price.get((channel, cake), np.nan) for cake, channel in cost.columns]
+    known = (model.lookup(pairs["cake"], pairs["channel"]) >= 0) & pairs["max_price"].notna().to_numpy()
+    pairs = pairs[known].reset_index(drop=True)
+    names = cost.index.tolist()
+    cost = cost.loc[:, known].to_numpy(dtype=float)
+    teams = len(names)
+
+    # Every team × pair as one flat array, team by team
+    cakes = np.tile(pairs["cake"].to_numpy(dtype=object), teams)
+    channels = np.tile(pairs["channel"].to_numpy(dtype=object), teams)
+    caps = np.tile(pairs["max_price"].to_numpy(dtype=float), teams)
+    flat_cost = cost.ravel()
+
+    def others_mean(prices):
+        if teams < 2:
+            return np.full(prices.shape, np.nan)
+        return (prices.sum(axis=0) - prices) / (teams - 1)
+
+    def best_response(prices, whole_units=False):
+        return model.optimal_prices(cakes, channels, flat_cost, caps, others_mean(prices).ravel(),
+                                    own_weight=1.0 / teams, whole_units=whole_units).reshape(prices.shape)
+
+    def demand_at(prices, others):
+        """Each team's demand at `prices` when the other teams' mean is `others`."""
+        avg = np.where(np.isnan(others), prices, (prices + (teams - 1) * others) / teams)
+        return model.demand(cakes, channels, prices.ravel(), avg.ravel()).reshape(prices.shape)
+
+    prices = model.optimal_prices(cakes, channels, flat_cost, caps, whole_units=False).reshape(cost.shape)
+    gap = np.inf
+    iterations = 0
+    while iterations < max_iter:
+        step = best_response(prices) - prices
+        gap = float(np.abs(step).max()) if step.size else 0.0
+        if gap <= tol:
+            break
+        prices = prices + damping * step
+        iterations += 1
+
+    prices = best_response(prices, whole_units=True)
+    others = others_mean(prices)
+    demand = demand_at(prices, others)
+    deviation = best_response(prices, whole_units=True)
+    regret = demand_at(deviation, others) * (deviation - cost) - demand * (prices - cost)
+
+    return Equilibrium(
+        teams=names,
+        pairs=pairs,
+        cost=cost,
+        prices=prices,
+        demand=demand,
+        regret=np.maximum(regret, 0.0),
+        iterations=iterations,
+        converged=gap <= tol,
+        gap=gap,
+        seconds=time.perf_counter() - start,
+    )
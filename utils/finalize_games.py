@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-Game Finalization — Cake Simulation
+
+Closes rounds for several games (course sections) at the same time. Each
+game runs in its own worker thread against its own Supabase project (see
+utils.db.get_client); a failure in one game is captured in its report entry and
+never stops the others.
+
+Finalizing does not move a game to the next round. With `--advance`, each
+game whose round finalized (or was already finalized) and is still its
+current round is advanced, as the Admin panel's "Move to Round" button does.
+
+Run from the repository root:
+
+    python -m utils.finalize_games section_a section_b section_c
+    python -m utils.finalize_games section_a section_b --advance
+    CAKEGAME_GAMES=section_a,section_b python -m utils.finalize_games --workers 4
+"""
+
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils.db import get_client, get_current_round, set_current_round
+from utils.finalize_round import finalize_round
+
+
+MAX_WORKERS = 16
+
+
+def advance_round(supabase, finalized_round):
+    """
+    Move a game on from `finalized_round` unless it has already moved.
+    Returns whether it was advanced.
+    """
+    if get_current_round(supabase=supabase) != finalized_round:
+        return False
+    new_round = finalized_round + 1
+    set_current_round(new_round, supabase)
+    supabase.table("teams").update({"round_number": new_round}).neq("team_name", "").execute()
+    return True
+
+
+def _finalize_game(game_id, round_number, client_factory, advance=False):
+    start = time.perf_counter()
+    advanced = False
+    try:
+        supabase = client_factory(game_id)
+        if round_number is None:
+            round_number = get_current_round(supabase=supabase)
+        report = finalize_round(round_number, supabase=supabase, game_id=game_id)
+        status = "skipped" if report.get("skipped") else "done"
+        if advance:
+            advanced = advance_round(supabase, round_number)
+        error = None
+    except Exception:
+        report = None
+        status = "failed"
+        error = traceback.format_exc()
+        print(f"[{game_id}] ❌ Finalization failed:\n{error}")
+
+    return {
+        "game_id": game_id,
+        "round_number": round_number,
+        "status": status,
+        "advanced": advanced,
+        "seconds": time.perf_counter() - start,
+        "report": report,
+        "error": error,
+    }
+
+
+def finalize_games(games, max_workers=None, client_factory=get_client, advance=False):
+    """
+    Finalize many games concurrently.
+
+    `games` is an iterable of game ids (each game's current round is
+    finalized) or a {game_id: round_number} mapping. With `advance`, each
+    settled game then moves to the next round (see advance_round). Returns
+    an aggregated report: one entry per game, in input order, plus
+    success/failure counts.
+    """
+    if not isinstance(games, dict):
+        games = {game_id: None for game_id in games}
+
+    start = time.perf_counter()
+    results = []
+    if games:
+        workers = max_workers or min(len(games), MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="finalize-game") as pool:
+            futures = [
+                pool.submit(_finalize_game, game_id, round_number, client_factory, advance)
+                for game_id, round_number in games.items()
+            ]
+            results = [f.result() for f in futures]
+
+    return {
+        "games": results,
+        "succeeded": sum(1 for r in results if r["status"] != "failed"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "wall_seconds": time.perf_counter() - start,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Finalize the current round of several games at once.")
+    parser.add_argument("games", nargs="*",
+                        help="game ids (default: comma-separated CAKEGAME_GAMES)")
+    parser.add_argument("--round", type=int, help="round to finalize in every game (default: each game's current round)")
+    parser.add_argument("--workers", type=int, help=f"parallel games (default: up to {MAX_WORKERS})")
+    parser.add_argument("--advance", action="store_true",
+                        help="move each game to the next round once its round is finalized")
+    args = parser.parse_args(argv)
+
+    games = args.games or [g.strip() for g in os.getenv("CAKEGAME_GAMES", "").split(",") if g.strip()]
+    if not games:
+        parser.error("no games given (pass ids or set CAKEGAME_GAMES)")
+
+    summary = finalize_games({g: args.round for g in games}, max_workers=args.workers, advance=args.advance)
+
+    print(pd.DataFrame([
+        {
+            "game": r["game_id"],
+            "round": r["round_number"],
+            "status": r["status"],
+            "advanced": r["advanced"],
+            "seconds": round(r["seconds"], 2),
+            "round-trips": r["report"]["round_trips"] if r["report"] else None,
+        }
+        for r in summary["games"]
+    ]).to_string(index=False))
+    print(f"\n{summary['succeeded']} succeeded, {summary['failed']} failed "
+          f"in {summary['wall_seconds']:.2f}s")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Background Round Finalization — Cake Simulation
+
+Runs finalize_round in a worker thread so the Admin page never blocks on
+it. Jobs live in a process-wide registry that any session can poll for
+free; per-team progress is persisted by finalize_round itself through
+`teams.last_finalized_round`, so a crashed or failed job is resumed simply
+by starting it again.
+"""
+
+import threading
+import traceback
+from datetime import datetime
+
+from utils.finalize_round import BEIRUT_TZ, finalize_round
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class FinalizeJob:
+    """Status of one background finalization of `round_number`."""
+
+    def __init__(self, round_number, on_success=None):
+        self.round_number = round_number
+        self.on_success = on_success
+        self.status = "queued"
+        self.teams_done = 0
+        self.teams_total = 0
+        self.error = None
+        self.report = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def snapshot(self):
+        """Plain-dict copy of the current status, safe to render."""
+        with self._lock:
+            return {
+                "round_number": self.round_number,
+                "status": self.status,
+                "teams_done": self.teams_done,
+                "teams_total": self.teams_total,
+                "error": self.error,
+                "report": self.report,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+    def _progress(self, done, total):
+        with self._lock:
+            self.teams_done = done
+            self.teams_total = total
+
+    def _run(self):
+        with self._lock:
+            self.status = "running"
+            self.started_at = datetime.now(BEIRUT_TZ)
+        try:
+            report = finalize_round(self.round_number, progress=self._progress)
+            with self._lock:
+                self.report = report
+            if self.on_success is not None:
+                self.on_success(self.round_number)
+        except Exception:
+            with self._lock:
+                self.status = "failed"
+                self.error = traceback.format_exc()
+                self.finished_at = datetime.now(BEIRUT_TZ)
+            print(f"❌ Finalization of Round {self.round_number} failed:\n{self.error}")
+            return
+
+        with self._lock:
+            self.status = "done"
+            self.finished_at = datetime.now(BEIRUT_TZ)
+
+
+def start_finalize_job(round_number: int, on_success=None):
+    """
+    Start finalizing `round_number` in the background, or return the job
+    already running for it. `on_success(round_number)` runs in the worker
+    thread after every team has been settled.
+    """
+    with _jobs_lock:
+        job = _jobs.get(round_number)
+        if job is not None and job.active:
+            return job
+
+        job = FinalizeJob(round_number, on_success=on_success)
+        _jobs[round_number] = job
+
+    threading.Thread(
+        target=job._run, name=f"finalize-round-{round_number}", daemon=True
+    ).start()
+    return job
+
+
+def get_finalize_job(round_number: int):
+    """The most recent job for `round_number` in this process, if any."""
+    with _jobs_lock:
+        return _jobs.get(round_number)
+
+
+def list_finalize_jobs():
+    """Every job started in this process, oldest round first."""
+    with _jobs_lock:
+        return [_jobs[r] for r in sorted(_jobs)]
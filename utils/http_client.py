@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Resilient HTTP Layer — Cake Simulation
+
+The shared Supabase client (utils.db.get_client) talks through one httpx
+client per game with a bounded connection pool. Requests wait up to
+POOL_TIMEOUT for a free connection instead of failing when every team
+submits at once, and transient failures are retried with jittered
+exponential backoff:
+
+- anything that never reached the server (connect errors, pool timeouts)
+  and 429 responses: always retried;
+- idempotent requests (GET/HEAD, PATCH/DELETE by filter, upserts keyed by
+  on_conflict, requests carrying an Idempotency-Key header, read-only
+  RPCs): also retried on read errors and 502/503/504;
+- other writes (plain inserts, write RPCs): never resent once sent.
+
+pool_stats() reports in-flight requests, saturation and retry counters.
+"""
+
+import random
+import threading
+import time
+
+import httpx
+
+
+MAX_CONNECTIONS = 50
+MAX_KEEPALIVE_CONNECTIONS = 20
+POOL_TIMEOUT = 15.0
+TIMEOUT = httpx.Timeout(30.0, connect=5.0, pool=POOL_TIMEOUT)
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 4.0
+RETRY_STATUSES = {502, 503, 504}
+
+# RPCs that only read, so resending them is harmless
+READ_ONLY_RPCS = {"latest_prices_per_team"}
+
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+IN_FLIGHT_ERRORS = (httpx.ReadError, httpx.ReadTimeout, httpx.WriteError,
+                    httpx.WriteTimeout, httpx.RemoteProtocolError)
+
+
+class PoolStats:
+    """
+    Thread-safe counters for one pool. `in_flight` includes requests still
+    waiting for a connection, so saturation above 1.0 means queueing.
+    """
+
+    def __init__(self, max_connections):
+        self.max_connections = max_connections
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.retries = 0
+        self.pool_timeouts = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "saturation": self.in_flight / self.max_connections,
+                "peak_saturation": self.peak_in_flight / self.max_connections,
+                "retries": self.retries,
+                "pool_timeouts": self.pool_timeouts,
+                "failures": self.failures,
+            }
+
+
+def is_idempotent(request):
+    """True when sending `request` twice has the same effect as once."""
+    if request.method in ("GET", "HEAD", "OPTIONS", "PATCH", "PUT", "DELETE"):
+        return True
+    if "idempotency-key" in request.headers:
+        return True
+    if "resolution=merge-duplicates" in request.headers.get("prefer", ""):
+        return True
+    path = request.url.path
+    return "/rpc/" in path and path.rsplit("/", 1)[-1] in READ_ONLY_RPCS
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff; honours a numeric Retry-After."""
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """Pooled HTTP transport that retries transient failures (see module docstring)."""
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_keepalive=MAX_KEEPALIVE_CONNECTIONS,
+                 max_retries=MAX_RETRIES):
+        self.stats = PoolStats(max_connections)
+        self.max_retries = max_retries
+        self._transport = httpx.HTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive),
+        )
+
+    def handle_request(self, request):
+        idempotent = is_idempotent(request)
+        attempt = 0
+        while True:
+            retry_after = None
+            self.stats.started()
+            try:
+                response = self._transport.handle_request(request)
+            except NOT_SENT_ERRORS as e:
+                if isinstance(e, httpx.PoolTimeout):
+                    self.stats.count("pool_timeouts")
+                error = e
+            except IN_FLIGHT_ERRORS as e:
+                if not idempotent:
+                    self.stats.count("failures")
+                    raise
+                error = e
+            else:
+                status = response.status_code
+                if status != 429 and not (idempotent and status in RETRY_STATUSES):
+                    return response
+                if attempt >= self.max_retries:
+                    return response
+                retry_after = response.headers.get("retry-after")
+                response.read()
+                response.close()
+                error = None
+            finally:
+                self.stats.finished()
+
+            if attempt >= self.max_retries:
+                self.stats.count("failures")
+                raise error
+            attempt += 1
+            self.stats.count("retries")
+            time.sleep(backoff_delay(attempt, retry_after))
+
+    def close(self):
+        self._transport.close()
+
+
+_transports = []
+_transports_lock = threading.Lock()
+
+
+def resilient_http_client():
+    """New httpx.Client on a ResilientTransport whose stats pool_stats() reports."""
+    transport = ResilientTransport()
+    with _transports_lock:
+        _transports.append(transport)
+    return httpx.Client(transport=transport, timeout=TIMEOUT, follow_redirects=True)
+
+
+def pool_stats():
+    """One stats snapshot per pool created in this process."""
+    with _transports_lock:
+        return [t.stats.snapshot() for t in _transports]
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+Offline Backend — Cake Simulation
+
+In-memory stand-in for the Supabase client. It implements the subset of
+the PostgREST query builder this app uses (table().select/insert/upsert/
+update/delete with eq/neq/lt/lte/order/limit/single/maybe_single, plus the
+RPCs the app calls), so the app can be run, load-tested and benchmarked
+with no network.
+
+Set CAKEGAME_BACKEND=offline to make utils.db.get_client() return a seeded
+OfflineClient (see offline_client) instead of connecting to Supabase.
+"""
+
+import json
+import os
+import threading
+import time
+
+import bcrypt
+import pandas as pd
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def reference_tables():
+    """`cakes`, `channels` and `recipes` rows built from the CSVs in data/."""
+    cakes = pd.read_csv(os.path.join(DATA_DIR, "cakes.csv")).rename(columns={
+        "cake_id": "id",
+        "packaging_cost_usd": "packaging_cost_per_unit_usd",
+        "min_units_if_made": "minimum_units_if_made",
+    })
+    channels = pd.read_csv(os.path.join(DATA_DIR, "channels.csv"))
+    recipes = pd.read_csv(os.path.join(DATA_DIR, "bill_of_materials.csv"))
+    recipes.insert(0, "id", recipes["cake_id"])
+
+    return {
+        "cakes": json.loads(cakes.to_json(orient="records")),
+        "channels": json.loads(channels.to_json(orient="records")),
+        "recipes": json.loads(recipes.to_json(orient="records")),
+    }
+
+
+def demo_tables(n_teams=4, password="demo", money=1000.0):
+    """Reference tables plus `n_teams` teams (team_1 …) at the start of Round 1."""
+    tables = reference_tables()
+    # One hash for every team: bcrypt is deliberately slow
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    tables["teams"] = [
+        {
+            "id": i,
+            "team_name": f"team_{i}",
+            "password": hashed,
+            "money": float(money),
+            "stock_value": 0.0,
+            "total_value": float(money),
+            "round_number": 1,
+            "last_finalized_round": 0,
+        }
+        for i in range(1, n_teams + 1)
+    ]
+    tables["game_state"] = [
+        {"id": 1, "key": "current_round", "value": "1"},
+        {"id": 2, "key": "locked", "value": "false"},
+    ]
+    for name in ("prices", "production_plans", "investments", "inventory", "demands"):
+        tables[name] = []
+    return tables
+
+
+def offline_client():
+    """
+    Seeded OfflineClient configured from the environment:
+    CAKEGAME_OFFLINE_TEAMS (default 4), CAKEGAME_OFFLINE_PASSWORD (default
+    "demo") and CAKEGAME_OFFLINE_LATENCY_MS (default 0).
+    """
+    tables = demo_tables(
+        n_teams=int(os.getenv("CAKEGAME_OFFLINE_TEAMS", "4")),
+        password=os.getenv("CAKEGAME_OFFLINE_PASSWORD", "demo"),
+    )
+    return OfflineClient(tables, latency=float(os.getenv("CAKEGAME_OFFLINE_LATENCY_MS", "0")) / 1000)
+
+
+class OfflineAPIError(Exception):
+    """Raised where PostgREST would answer with an error."""
+
+
+class OfflineResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class OfflineQuery:
+    """Chainable query builder over one in-memory table."""
+
+    def __init__(self, client, table):
+        self._client = client
+        self._table = table
+        self._action = "select"
+        self._columns = None
+        self._payload = None
+        self._on_conflict = "id"
+        self._count = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._offset = 0
+        self._single = None
+
+    # --- actions ---
+    def select(self, columns="*", count=None):
+        self._action = "select"
+        self._columns = _parse_columns(columns)
+        self._count = count
+        return self
+
+    def insert(self, json, **kwargs):
+        self._action = "insert"
+        self._payload = json
+        return self
+
+    def upsert(self, json, on_conflict="", **kwargs):
+        self._action = "upsert"
+        self._payload = json
+        self._on_conflict = on_conflict or "id"
+        return self
+
+    def update(self, json, **kwargs):
+        self._action = "update"
+        self._payload = json
+        return self
+
+    def delete(self, **kwargs):
+        self._action = "delete"
+        return self
+
+    # --- filters ---
+    def eq(self, column, value):
+        return self._filter(column, lambda v: v == value)
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: v != value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v <= value)
+
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self._limit = size
+        return self
+
+    def range(self, start, end):
+        """Rows `start` to `end` (inclusive) of the result, like PostgREST."""
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    def single(self):
+        """Return one row as `data`; error unless exactly one row matches."""
+        self._single = "single"
+        return self
+
+    def maybe_single(self):
+        """Like single(), but `data` is None when no row matches."""
+        self._single = "maybe"
+        return self
+
+    def _filter(self, column, predicate):
+        self._filters.append((column, predicate))
+        return self
+
+    # --- execution ---
+    def execute(self):
+        return self._client._execute(self)
+
+    def _matches(self, row):
+        return all(predicate(row.get(column)) for column, predicate in self._filters)
+
+
+def _parse_columns(columns):
+    columns = [c.strip() for c in (columns or "*").split(",")]
+    return None if "*" in columns else columns
+
+
+def _sort_key(value):
+    # NULLs sort last, like Postgres in ascending order
+    return (value is None, value if value is not None else 0)
+
+
+class OfflineClient:
+    """
+    Thread-safe in-memory database with a Supabase-like interface.
+
+    `tables` seeds the store ({table: [row, ...]}); `latency` adds a fixed
+    delay in seconds to every request to model network round-trips.
+    """
+
+    def __init__(self, tables=None, latency=0.0):
+        self.tables = {name: [dict(r) for r in rows] for name, rows in (tables or {}).items()}
+        self.latency = latency
+        self.requests = 0
+        self._next_id = {}
+        self._lock = threading.RLock()
+        for name, rows in self.tables.items():
+            self._next_id[name] = max((r.get("id") or 0 for r in rows), default=0) + 1
+            # Seeded rows get ids like inserted ones, so upserts on id find them
+            for row in rows:
+                if row.get("id") is None:
+                    row["id"] = self._new_id(name)
+
+    def table(self, name):
+        return OfflineQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return OfflineRpc(self, name, params or {})
+
+    # --- internals ---
+    def _rows(self, name):
+        return self.tables.setdefault(name, [])
+
+    def _new_id(self, name):
+        next_id = self._next_id.get(name, 1)
+        self._next_id[name] = next_id + 1
+        return next_id
+
+    def _insert(self, name, row):
+        row = dict(row)
+        if row.get("id") is None:
+            row["id"] = self._new_id(name)
+        else:
+            self._next_id[name] = max(self._next_id.get(name, 1), row["id"] + 1)
+        self._rows(name).append(row)
+        return row
+
+    def _round_trip(self):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _execute(self, query):
+        self._round_trip()
+        with self._lock:
+            data, count = self._run(query)
+        # Round-trip through JSON like the real client, so callers never
+        # share mutable rows with the store.
+        return OfflineResponse(json.loads(json.dumps(data)), count)
+
+    def _run(self, query):
+        name = query._table
+        payload = query._payload
+        rows = payload if isinstance(payload, list) else [payload]
+
+        if query._action == "insert":
+            return [self._insert(name, r) for r in rows], None
+
+        if query._action == "update":
+            updated = [r for r in self._rows(name) if query._matches(r)]
+            for r in updated:
+                r.update(payload)
+            return updated, None
+
+        if query._action == "delete":
+            kept, deleted = [], []
+            for r in self._rows(name):
+                (deleted if query._matches(r) else kept).append(r)
+            self.tables[name] = kept
+            return deleted, None
+
+        if query._action == "upsert":
+            keys = [k.strip() for k in query._on_conflict.split(",")]
+            index = {tuple(r.get(k) for k in keys): r for r in self._rows(name)}
+            written = []
+            for r in rows:
+                key = tuple(r.get(k) for k in keys)
+                existing = index.get(key)
+                if existing is not None:
+                    existing.update(r)
+                else:
+                    existing = index[key] = self._insert(name, r)
+                written.append(existing)
+            return written, None
+
+        selected = [r for r in self._rows(name) if query._matches(r)]
+        count = len(selected) if query._count else None
+        for column, desc in reversed(query._order):
+            selected.sort(key=lambda r: _sort_key(r.get(column)), reverse=desc)
+        if query._offset:
+            selected = selected[query._offset:]
+        if query._limit is not None:
+            selected = selected[:query._limit]
+        if query._columns is not None:
+            selected = [{c: r.get(c) for c in query._columns} for r in selected]
+        if query._single is not None:
+            if len(selected) > 1 or (not selected and query._single == "single"):
+                raise OfflineAPIError(f"Expected a single row from {name}, got {len(selected)}")
+            return (selected[0] if selected else None), count
+        return selected, count
+
+
+class OfflineRpc:
+    def __init__(self, client, name, params):
+        self._client = client
+        self._name = name
+        self._params = params
+
+    def execute(self):
+        handler = RPCS.get(self._name)
+        if handler is None:
+            raise OfflineAPIError(f"Unknown RPC: {self._name}")
+        self._client._round_trip()
+        with self._client._lock:
+            data = handler(self._client, self._params)
+        return OfflineResponse(json.loads(json.dumps(data)))
+
+
+# =====================================
+# 🧮 RPCs (mirror the database functions)
+# =====================================
+def _latest_prices_per_team(client, params):
+    latest = {}
+    for row in client._rows("prices"):
+        if row.get("round_number") is None or row["round_number"] > params["p_round"]:
+            continue
+        key = (row["round_number"], row.get("id") or 0)
+        best = latest.get(row["team_name"])
+        if best is None or key > best[0]:
+            latest[row["team_name"]] = (key, row)
+
+    teams = [t["team_name"] for t in client._rows("teams")]
+    return [latest[t][1] for t in teams if t in latest]
+
+
+# Capacity wage parameter → inventory resource name used by the plan page
+CAPACITY_RESOURCES = {
+    "prep_wage_usd_per_hour": "prep",
+    "oven_wage_usd_per_hour": "oven",
+    "package_wage_usd_per_hour": "package",
+    "oven_rental_wage_usd_per_hour": "oven rental",
+}
+
+
+def _team_row(client, team_name):
+    for row in client._rows("teams"):
+        if row["team_name"] == team_name:
+            return row
+    raise OfflineAPIError(f"Unknown team: {team_name}")
+
+
+def _adjust_inventory(client, team_name, category, resource_name, delta):
+    """Add `delta` to one inventory quantity (resource names match case-insensitively)."""
+    for row in client._rows("inventory"):
+        if (row["team_name"] == team_name and row["category"] == category
+                and str(row["resource_name"]).lower() == str(resource_name).lower()):
+            row["quantity"] = float(row.get("quantity") or 0) + float(delta)
+            return
+    client._insert("inventory", {
+        "team_name": team_name,
+        "category": category,
+        "resource_name": resource_name,
+        "quantity": float(delta),
+    })
+
+
+def _save_investment_atomic(client, params):
+    """Record a purchase, pay for it and add it to the team's inventory."""
+    team = _team_row(client, params["p_team_name"])
+    total = float(params["p_total"])
+    if total > float(team.get("money") or 0):
+        raise OfflineAPIError("Insufficient funds")
+
+    ingredients = params.get("p_ingredients") or []
+    capacity = params.get("p_capacity") or []
+    row = client._insert("investments", {
+        "team_name": team["team_name"],
+        "round_number": params["p_round"],
+        "ingredients_json": json.dumps(ingredients),
+        "capacity_json": json.dumps(capacity),
+        "total_cost_usd": total,
+    })
+
+    for entry in ingredients:
+        if float(entry.get("buy_qty") or 0):
+            _adjust_inventory(client, team["team_name"], "ingredient", entry["ingredient"], entry["buy_qty"])
+    for entry in capacity:
+        if float(entry.get("hours") or 0):
+            resource = CAPACITY_RESOURCES.get(entry["parameter"], entry.get("display_name", entry["parameter"]))
+            _adjust_inventory(client, team["team_name"], "capacity", resource, entry["hours"])
+
+    team["money"] = float(team["money"]) - total
+    team["stock_value"] = float(team.get("stock_value") or 0) + total
+    return row
+
+
+def _save_production_plan_atomic(client, params):
+    """Store a team's plan for the round and consume the stock it uses."""
+    team = _team_row(client, params["p_team_name"])
+    for row in client._rows("production_plans"):
+        if row["team_name"] == team["team_name"] and row["round_number"] == params["p_round"]:
+            raise OfflineAPIError("Production plan already submitted for this round")
+
+    row = client._insert("production_plans", {
+        "team_name": team["team_name"],
+        "round_number": params["p_round"],
+        "plan_json": json.dumps(params.get("p_plan") or []),
+        "required_json": json.dumps(params.get("p_required") or {}),
+        "profit_usd": float(params.get("p_profit") or 0),
+    })
+    for ingredient, qty in (params.get("p_ing_used") or {}).items():
+        _adjust_inventory(client, team["team_name"], "ingredient", ingredient, -float(qty))
+    for resource, hours in (params.get("p_cap_used") or {}).items():
+        _adjust_inventory(client, team["team_name"], "capacity", resource, -float(hours))
+    return row
+
+
+def _settle_teams_batch(client, params):
+    """Apply settled profits and costs to the current team rows (sql/settle_teams.sql)."""
+    settled = []
+    for item in params.get("p_teams") or []:
+        team = _team_row(client, item["team_name"])
+        if team.get("last_finalized_round") == params["p_round"]:
+            continue
+        money = float(team.get("money") or 0) + float(item.get("profit") or 0)
+        stock = float(team.get("stock_value") or 0)
+        if item.get("resource_cost") is not None:
+            stock = max(stock - float(item["resource_cost"]), 0)
+        team.update({"money": money, "stock_value": stock, "total_value": money + stock,
+                     "last_finalized_round": params["p_round"]})
+        for key, column in (("profit", "last_profit"), ("transport", "last_transport_cost"),
+                            ("resource_cost", "last_resource_cost"), ("packaging", "last_packaging_cost")):
+            if item.get(key) is not None:
+                team[column] = float(item[key])
+        settled.append(team["team_name"])
+    return settled
+
+
+def _batch(handler):
+    """Apply each item on its own, reporting {"ok": ..., "result": ...} per item (sql/submission_batches.sql)."""
+    def run(client, params):
+        results = []
+        for item in params.get("p_items") or []:
+            try:
+                results.append({"ok": True, "result": handler(client, item)})
+            except OfflineAPIError as e:
+                results.append({"ok": False, "error": str(e)})
+        return results
+    return run
+
+
+RPCS = {
+    "latest_prices_per_team": _latest_prices_per_team,
+    "settle_teams_batch": _settle_teams_batch,
+    "save_investment_atomic": _save_investment_atomic,
+    "save_production_plan_atomic": _save_production_plan_atomic,
+    "save_investments_batch": _batch(_save_investment_atomic),
+    "save_production_plans_batch": _batch(_save_production_plan_atomic),
+}
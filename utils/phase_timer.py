@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Phase Timer — Cake Simulation
+
+Wall time and database round-trips per named phase of a long operation
+(used by finalize_round). Starting a phase closes the previous one, and
+queries are run through `timer.execute(query)` so each request is counted
+against the phase it belongs to.
+"""
+
+import time
+
+
+class PhaseTimer:
+    """Collects (phase, seconds, round_trips) in the order phases ran."""
+
+    def __init__(self):
+        self.phases = []
+        self._current = None
+        self._phase_start = None
+        self._started = time.perf_counter()
+
+    def start(self, name):
+        """Close the running phase (if any) and start timing `name`."""
+        self.stop()
+        self._current = {"phase": name, "seconds": 0.0, "round_trips": 0}
+        self.phases.append(self._current)
+        self._phase_start = time.perf_counter()
+
+    def stop(self):
+        if self._current is not None:
+            self._current["seconds"] = time.perf_counter() - self._phase_start
+            self._current = None
+
+    def execute(self, query):
+        """Run a query builder's execute() and count it as one round-trip."""
+        if self._current is not None:
+            self._current["round_trips"] += 1
+        return query.execute()
+
+    def report(self, **extra):
+        """Stop timing and return per-phase rows plus totals as a plain dict."""
+        self.stop()
+        return {
+            **extra,
+            "phases": [dict(p) for p in self.phases],
+            "total_seconds": time.perf_counter() - self._started,
+            "round_trips": sum(p["round_trips"] for p in self.phases),
+        }
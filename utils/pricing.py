@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Price Recommender — Cake Simulation
+
+Suggested prices for every cake × channel in one call: the closed-form
+profit-maximizing price of the shared demand rule
+(utils.demand.DemandModel.optimal_prices), capped by price_caps.csv, for
+the competitor averages of the round and each unit's full cost:
+
+- transport (`channels`) and packaging (`cakes`);
+- ingredients: the cake's recipe priced with ingredients.csv;
+- labour: prep and packing time per unit plus oven time per batch spread
+  over a full batch, at the rates in wages_energy.csv (oven time also
+  pays the oven rental rate), as the Production Plan page counts it.
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.demand import average_prices
+
+
+def unit_costs(catalog):
+    """One row per capped (cake, channel): each cost component and `unit_cost`."""
+    cakes = catalog.cakes.set_index("name")
+    wages = catalog.wage_rates
+    recipes = catalog.recipes
+
+    ing_prices = np.array([catalog.ingredient_cost.get(ing.lower(), 0.0) for ing in recipes.ingredients])
+    ingredient_cost = dict(zip(recipes.cakes, recipes.matrix @ ing_prices)) if recipes.cakes else {}
+
+    hours = lambda col: cakes[col].astype(float) / 60.0 if col in cakes else pd.Series(0.0, index=cakes.index)
+    labour = (
+        hours("prep_min_per_unit") * wages.get("prep", 0.0)
+        + hours("pack_min_per_unit") * wages.get("package", 0.0)
+        + hours("oven_min_per_batch") / cakes["batch_size_units"].astype(float).where(lambda b: b > 0)
+        * (wages.get("oven", 0.0) + wages.get("oven rental", 0.0))
+    ).fillna(0.0).to_dict()
+
+    rows = []
+    for (channel, cake), cap in catalog.max_price.items():
+        row = {
+            "cake": cake,
+            "channel": channel,
+            "transport": float(catalog.transport_cost.get(channel, 0) or 0),
+            "packaging": float(catalog.packaging_cost.get(cake, 0) or 0),
+            "ingredients": float(ingredient_cost.get(str(cake).lower(), 0.0)),
+            "labour": float(labour.get(cake, 0.0)),
+            "max_price": cap,
+        }
+        row["unit_cost"] = row["transport"] + row["packaging"] + row["ingredients"] + row["labour"]
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def recommend_prices(catalog, avg_price):
+    """
+    Suggested price for every capped (cake, channel) with demand
+    parameters, given {(channel, cake): competitor average}, with the
+    expected demand and profit (after all unit costs) at that price.
+    """
+    frame = unit_costs(catalog)
+    if frame.empty:
+        return frame
+
+    model = catalog.demand_model
+    frame["avg_price"] = average_prices(avg_price, frame["channel"], frame["cake"])
+    frame["price"] = model.optimal_prices(frame["cake"], frame["channel"], frame["unit_cost"],
+                                          frame["max_price"], frame["avg_price"])
+    frame["demand"] = model.demand(frame["cake"], frame["channel"], frame["price"], frame["avg_price"])
+    frame["profit"] = frame["demand"] * (frame["price"] - frame["unit_cost"])
+    return frame[frame["price"].notna()].reset_index(drop=True)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Query Tracer — Cake Simulation
+
+TracingClient wraps a Supabase (or offline) client and records every
+request: table or RPC, action, filters, rows returned, payload and
+response bytes, and latency. utils.db.get_client() returns traced clients.
+
+Each record goes to the "cakegame.queries" logger as one JSON line (set
+CAKEGAME_QUERY_LOG=<path> to append them to a file). A page calls
+start_trace() at the top of its script to also collect the requests of
+the current rerun; with ?debug=1 in the URL or CAKEGAME_DEBUG_QUERIES=1
+they are listed live in the sidebar.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+
+logger = logging.getLogger("cakegame.queries")
+if os.getenv("CAKEGAME_QUERY_LOG"):
+    _handler = logging.FileHandler(os.getenv("CAKEGAME_QUERY_LOG"), encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+FILTER_METHODS = {
+    "eq", "neq", "lt", "lte", "gt", "gte", "in_", "is_", "like", "ilike",
+    "order", "limit", "range", "single", "maybe_single",
+}
+WRITE_METHODS = {"insert", "upsert", "update"}
+
+_current_trace = contextvars.ContextVar("query_trace", default=None)
+
+
+def _size(data):
+    try:
+        return len(json.dumps(data, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class QueryTrace:
+    """Requests made while this trace is current (one page rerun)."""
+
+    def __init__(self, page, placeholder=None):
+        self.page = page
+        self.records = []
+        self.started = time.perf_counter()
+        self._placeholder = placeholder
+        self._thread = threading.get_ident()
+
+    def add(self, record):
+        # Requests can run on worker threads (utils.db.read_concurrently);
+        # only the script thread may draw, so they are drawn on refresh().
+        self.records.append(record)
+        if threading.get_ident() == self._thread:
+            self.refresh()
+
+    def refresh(self):
+        if self._placeholder is not None:
+            self._render()
+
+    def summary(self):
+        return {
+            "requests": len(self.records),
+            "rows": sum(r["rows"] for r in self.records),
+            "bytes": sum(r["bytes"] + r["payload_bytes"] for r in self.records),
+            "query_ms": sum(r["ms"] for r in self.records),
+        }
+
+    def _render(self):
+        s = self.summary()
+        with self._placeholder.container():
+            st.markdown("**🐞 Queries this rerun**")
+            st.caption(
+                f"{s['requests']} requests · {s['rows']} rows · "
+                f"{s['bytes'] / 1024:.1f} KiB · {s['query_ms']:.0f} ms"
+            )
+            st.dataframe(
+                pd.DataFrame(self.records, columns=["target", "action", "filters", "rows", "bytes", "ms"]),
+                hide_index=True,
+            )
+
+
+def start_trace(page):
+    """Begin collecting this rerun's requests; shows them in the sidebar in debug mode."""
+    placeholder = None
+    if os.getenv("CAKEGAME_DEBUG_QUERIES") == "1" or st.query_params.get("debug") == "1":
+        placeholder = st.sidebar.empty()
+    trace = QueryTrace(page, placeholder)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def _record(target, action, filters, payload_bytes, start, data=None, error=None):
+    ms = (time.perf_counter() - start) * 1000
+    trace = _current_trace.get()
+    if trace is None and not logger.isEnabledFor(logging.INFO):
+        return
+    if isinstance(data, list):
+        rows = len(data)
+    else:
+        rows = 0 if data is None else 1
+    record = {
+        "page": trace.page if trace is not None else None,
+        "target": target,
+        "action": action,
+        "filters": ", ".join(filters),
+        "rows": rows,
+        "bytes": _size(data) if data is not None else 0,
+        "payload_bytes": payload_bytes,
+        "ms": round(ms, 2),
+        "error": error,
+    }
+    if trace is not None:
+        trace.add(record)
+    logger.info(json.dumps(record, default=str))
+
+
+class TracingQuery:
+    """Proxy over a query/RPC builder that records the request on execute()."""
+
+    def __init__(self, builder, target, action="select", payload_bytes=0):
+        self._builder = builder
+        self._target = target
+        self._action = action
+        self._filters = []
+        self._payload_bytes = payload_bytes
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if not hasattr(result, "execute"):
+                return result
+            self._builder = result
+            if name in FILTER_METHODS:
+                shown = [str(a) for a in args] + [f"{k}={v}" for k, v in kwargs.items()]
+                self._filters.append(f"{name}({', '.join(shown)})")
+            elif name in WRITE_METHODS or name in ("select", "delete"):
+                self._action = name
+                if name in WRITE_METHODS and (_current_trace.get() is not None or logger.isEnabledFor(logging.INFO)):
+                    self._payload_bytes = _size(args[0] if args else kwargs.get("json"))
+            return self
+
+        return call
+
+    def execute(self):
+        start = time.perf_counter()
+        try:
+            response = self._builder.execute()
+        except Exception as e:
+            _record(self._target, self._action, self._filters, self._payload_bytes, start, error=repr(e))
+            raise
+        _record(self._target, self._action, self._filters, self._payload_bytes, start,
+                data=getattr(response, "data", None))
+        return response
+
+
+class TracingClient:
+    """Client proxy: table() and rpc() builders are traced, everything else is forwarded."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name):
+        return TracingQuery(self._client.table(name), name)
+
+    def rpc(self, name, params=None, *args, **kwargs):
+        builder = self._client.rpc(name, params or {}, *args, **kwargs)
+        return TracingQuery(builder, f"rpc:{name}", action="rpc", payload_bytes=_size(params or {}))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
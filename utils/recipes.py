@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Recipe Matrix — Cake Simulation
+
+Dense cake × ingredient matrix built once from the `recipes` table (see
+utils.catalog). Ingredient needs become a matrix–vector product for one
+plan and a matrix–matrix product for every team at once.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+NON_INGREDIENT_COLUMNS = ["id", "cake_id", "name", "created_at"]
+
+
+class RecipeMatrix:
+    """Recipe quantities indexed by lower-cased cake name and ingredient column."""
+
+    def __init__(self, cakes, ingredients, matrix):
+        self.cakes = list(cakes)
+        self.ingredients = list(ingredients)
+        self.matrix = matrix
+        self.matrix.setflags(write=False)
+        self._row = {cake: i for i, cake in enumerate(self.cakes)}
+
+    def quantity_vector(self, qty_by_cake):
+        """Map {cake: qty} onto the matrix rows; unknown cakes are ignored."""
+        vec = np.zeros(len(self.cakes))
+        matched = False
+        for cake, qty in qty_by_cake.items():
+            i = self._row.get(str(cake).lower())
+            if i is None:
+                continue
+            vec[i] += float(qty)
+            matched = True
+        return vec, matched
+
+    def needs(self, qty_by_cake):
+        """Ingredient needs {ingredient: amount} for one plan's {cake: qty} totals."""
+        vec, matched = self.quantity_vector(qty_by_cake)
+        if not matched:
+            return {}
+        return dict(zip(self.ingredients, (vec @ self.matrix).tolist()))
+
+    def needs_matrix(self, quantities):
+        """(teams × cakes) quantities → (teams × ingredients) needs."""
+        return quantities @ self.matrix
+
+    def team_needs(self, lines):
+        """Per-team ingredient needs from plan lines (team_name, cake, qty)."""
+        if lines.empty:
+            return pd.DataFrame(columns=self.ingredients, dtype=float)
+
+        quantities = (
+            lines.assign(cake=lines["cake"].astype(str).str.lower())
+            .pivot_table(index="team_name", columns="cake", values="qty", aggfunc="sum", sort=False)
+            .reindex(columns=self.cakes)
+            .fillna(0.0)
+        )
+        return pd.DataFrame(
+            self.needs_matrix(quantities.to_numpy(dtype=float)),
+            index=quantities.index,
+            columns=self.ingredients,
+        )
+
+
+def recipe_matrix(records):
+    """Build a RecipeMatrix from `recipes` rows (list of dicts or DataFrame)."""
+    recipes_df = pd.DataFrame(records)
+    if recipes_df.empty:
+        return RecipeMatrix([], [], np.zeros((0, 0)))
+
+    recipes_df.columns = [c.lower() for c in recipes_df.columns]
+    recipes_df["name"] = recipes_df["name"].astype(str).str.lower()
+    recipes_df = recipes_df.drop_duplicates("name")
+
+    ingredients = [c for c in recipes_df.columns if c not in NON_INGREDIENT_COLUMNS]
+    matrix = recipes_df[ingredients].to_numpy(dtype=float)
+    return RecipeMatrix(recipes_df["name"], ingredients, matrix)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Settlement Engine — Cake Simulation (Round-based)
+
+Columnar version of the per-line sales loop: every team's plan lines are
+joined with their prices, the demand parameters and the unit costs in one
+pass, and demand / sold units / revenue / costs are computed as arrays.
+Demand follows the shared rule in utils.demand.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+
+from utils.demand import average_prices
+
+
+LINE_COLUMNS = ["team_name", "cake", "channel", "qty"]
+PRICE_COLUMNS = ["team_name", "channel", "cake", "price_usd", "round_used"]
+DEMAND_COLUMNS = ["team_name", "cake", "channel", "demand"]
+TOTAL_COLUMNS = ["profit", "transport", "packaging"]
+
+
+def _parse_json(raw, default):
+    if isinstance(raw, str):
+        return json.loads(raw)
+    return raw or default
+
+
+# =====================================
+# 📦 FLATTEN SUBMISSIONS
+# =====================================
+def plan_lines(plans_rows):
+    """One row per plan line, using the first plan each team submitted."""
+    seen = set()
+    records = []
+    for row in plans_rows:
+        team = row["team_name"]
+        if team in seen:
+            continue
+        seen.add(team)
+        for item in _parse_json(row["plan_json"], []):
+            records.append((team, item["cake"], item["channel"], item["qty"]))
+
+    return pd.DataFrame.from_records(records, columns=LINE_COLUMNS)
+
+
+def price_lines(price_records):
+    """One row per (team, channel, cake) price from each team's price record."""
+    records = []
+    for rec in price_records:
+        for item in _parse_json(rec.get("prices_json", []), []):
+            records.append((
+                rec["team_name"], item["channel"], item["cake"],
+                item["price_usd"], rec["round_number"],
+            ))
+
+    return pd.DataFrame.from_records(records, columns=PRICE_COLUMNS)
+
+
+def demand_lines(demand_rows):
+    """One row per (team, cake, channel) demand shown at submission."""
+    records = [
+        (row["team_name"], item["cake"], item["channel"], item["demand"])
+        for row in demand_rows
+        for item in _parse_json(row["demands_json"], [])
+    ]
+    return pd.DataFrame.from_records(records, columns=DEMAND_COLUMNS)
+
+
+def competitor_avg_prices(prices, lines):
+    """Mean price per (channel, cake) over teams that produce that cake."""
+    if prices.empty or lines.empty:
+        return {}
+
+    producing = lines[["team_name", "cake"]].drop_duplicates()
+    filtered = prices.merge(producing, on=["team_name", "cake"], how="inner")
+    if filtered.empty:
+        return {}
+
+    return filtered.groupby(["channel", "cake"])["price_usd"].mean().to_dict()
+
+
+# =====================================
+# 💰 SALES & PROFIT
+# =====================================
+def settle_sales(lines, prices, avg_price, demand_model, transport_costs, packaging_costs):
+    """
+    Compute sales for every plan line at once.
+
+    Returns (line_results, team_totals): the per-line frame with demand,
+    sold units, revenue and costs, and the per-team sums of profit,
+    transport and packaging for every team that has plan lines. Lines
+    without demand parameters (see utils.demand.DemandModel) are dropped.
+    """
+    teams = pd.Index(lines["team_name"].unique(), name="team_name")
+    if lines.empty:
+        return lines.copy(), pd.DataFrame(0.0, index=teams, columns=TOTAL_COLUMNS)
+
+    # First price per (team, cake, channel), like the row-by-row lookup
+    team_prices = (
+        prices.drop_duplicates(["team_name", "cake", "channel"])
+        [["team_name", "cake", "channel", "price_usd"]]
+    )
+    merged = lines.merge(team_prices, on=["team_name", "cake", "channel"], how="left")
+    merged = merged[demand_model.lookup(merged["cake"], merged["channel"]) >= 0].reset_index(drop=True)
+
+    avg = average_prices(avg_price, merged["channel"], merged["cake"])
+
+    # A line without a price sells at the competitor average (or 0)
+    price = merged["price_usd"].to_numpy(dtype=float)
+    my_price = np.where(np.isnan(price), np.nan_to_num(avg), price)
+    avg_p = np.where(np.isnan(avg), my_price, avg)
+    qty = np.floor(merged["qty"].to_numpy(dtype=float))
+
+    demand = demand_model.demand(merged["cake"], merged["channel"], my_price, avg_p)
+    sold = np.minimum(qty, demand)
+
+    transport_unit = merged["channel"].map(transport_costs).fillna(0).to_numpy(dtype=float)
+    packaging_unit = merged["cake"].map(packaging_costs).fillna(0).to_numpy(dtype=float)
+
+    merged["price"] = my_price
+    merged["avg_price"] = avg_p
+    merged["demand"] = demand
+    merged["sold"] = sold
+    merged["revenue"] = sold * my_price
+    merged["transport"] = sold * transport_unit
+    merged["packaging"] = sold * packaging_unit
+    merged["profit"] = merged["revenue"] - merged["transport"] - merged["packaging"]
+
+    team_totals = (
+        merged.groupby("team_name", sort=False)[TOTAL_COLUMNS].sum()
+        .reindex(teams, fill_value=0.0)
+    )
+    return merged, team_totals
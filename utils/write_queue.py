@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Write Queue — Cake Simulation
+
+Submissions from every session of a game go through one in-process queue
+instead of each session sending its own request. A flusher thread waits
+FLUSH_INTERVAL_SECONDS after the first pending submission, then writes
+everything that arrived with one request per kind (up to MAX_BATCH):
+
+- "prices", "demands": one bulk insert into the table;
+- "investment", "production_plan": one call to the batch RPC in
+  sql/submission_batches.sql, which applies each submission in its own
+  subtransaction.
+
+submit_write() returns a Future resolved with that submission's own
+result (the inserted row, or the RPC result) or failed with its own
+error, so one bad submission never fails the rest of its batch. When the
+server rejects a whole batch, nothing of it was applied, so its items are
+retried one request each; a batch lost in transit fails all its items and
+is never resent (see utils.http_client).
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+import httpx
+
+from utils.db import get_client
+
+
+FLUSH_INTERVAL_SECONDS = 0.2
+MAX_BATCH = 200
+WRITE_TIMEOUT_SECONDS = 60.0
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+class SubmissionError(Exception):
+    """A submission the database refused inside an otherwise successful batch."""
+
+
+def _one_by_one(write, payloads):
+    outcomes = []
+    for payload in payloads:
+        try:
+            outcomes.append((write(payload), None))
+        except Exception as e:
+            outcomes.append((None, e))
+    return outcomes
+
+
+def _bulk_insert(table):
+    def write(supabase, payloads):
+        try:
+            rows = supabase.table(table).insert(payloads).execute().data or []
+        except httpx.TransportError:
+            raise
+        except Exception:
+            if len(payloads) == 1:
+                raise
+            return _one_by_one(lambda p: supabase.table(table).insert(p).execute().data[0], payloads)
+        return [(row, None) for row in rows]
+    return write
+
+
+def _batch_rpc(batch_name, single_name):
+    def write(supabase, payloads):
+        try:
+            results = supabase.rpc(batch_name, {"p_items": payloads}).execute().data or []
+        except httpx.TransportError:
+            raise
+        except Exception:
+            # e.g. the batch function is not deployed yet
+            return _one_by_one(lambda p: supabase.rpc(single_name, p).execute().data, payloads)
+        return [
+            (r.get("result"), None) if r.get("ok") else (None, SubmissionError(r.get("error")))
+            for r in results
+        ]
+    return write
+
+
+WRITERS = {
+    "prices": _bulk_insert("prices"),
+    "demands": _bulk_insert("demands"),
+    "investment": _batch_rpc("save_investments_batch", "save_investment_atomic"),
+    "production_plan": _batch_rpc("save_production_plans_batch", "save_production_plan_atomic"),
+}
+
+
+class WriteQueue:
+    """Pending submissions of one client, flushed in batches by a daemon thread."""
+
+    def __init__(self, supabase, flush_interval=FLUSH_INTERVAL_SECONDS, max_batch=MAX_BATCH):
+        self.supabase = supabase
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.submissions = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.failures = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, kind, payload):
+        if kind not in WRITERS:
+            raise ValueError(f"Unknown submission kind: {kind}")
+        future = Future()
+        with self._cond:
+            self._pending.append((kind, payload, future))
+            self.submissions += 1
+            self._cond.notify()
+        return future
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "submissions": self.submissions,
+                "batches": self.batches,
+                "largest_batch": self.largest_batch,
+                "failures": self.failures,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Let the submissions of other sessions gather
+            time.sleep(self.flush_interval)
+            with self._cond:
+                pending, self._pending = self._pending, []
+            self._flush(pending)
+
+    def _flush(self, pending):
+        by_kind = {}
+        for item in pending:
+            by_kind.setdefault(item[0], []).append(item)
+
+        for kind, items in by_kind.items():
+            for start in range(0, len(items), self.max_batch):
+                batch = items[start:start + self.max_batch]
+                payloads = [payload for _, payload, _ in batch]
+                try:
+                    outcomes = WRITERS[kind](self.supabase, payloads)
+                except Exception as e:
+                    outcomes = [(None, e)] * len(batch)
+                if len(outcomes) != len(batch):
+                    error = SubmissionError(f"{kind}: {len(outcomes)} results for {len(batch)} submissions")
+                    outcomes = [(None, error)] * len(batch)
+
+                with self._cond:
+                    self.batches += 1
+                    self.largest_batch = max(self.largest_batch, len(batch))
+                    self.failures += sum(1 for _, error in outcomes if error is not None)
+                for (_, _, future), (result, error) in zip(batch, outcomes):
+                    if error is None:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(error)
+
+
+def get_write_queue(supabase=None):
+    """The shared WriteQueue of `supabase` (default: the default game's client)."""
+    supabase = supabase or get_client()
+    with _queues_lock:
+        queue = _queues.get(supabase)
+        if queue is None:
+            queue = _queues[supabase] = WriteQueue(supabase)
+        return queue
+
+
+def submit_write(kind, payload, supabase=None):
+    """Queue one submission (see WRITERS for kinds); returns its Future."""
+    return get_write_queue(supabase).submit(kind, payload)
+
+
+def queue_stats():
+    """One stats snapshot per write queue created in this process."""
+    with _queues_lock:
+        return [queue.stats() for queue in _queues.values()]